@@ -0,0 +1,313 @@
+"""
+Offline stand-ins for Apify, the video CDN and S3 used by the benchmarks.
+"""
+import hashlib
+import http.server
+import io
+import os
+import threading
+import time
+import uuid
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+
+from clients.apify import (
+    TikTokScrapperClient,
+    TikTokSoundScraperClient,
+    TikTokVideoDownloadClient,
+)
+from tiktokparser.utils.storages import S3MultipartWriter
+
+
+def _stable_int(value, digits):
+    return int(hashlib.sha1(value.encode()).hexdigest(), 16) % 10**digits
+
+
+def _project(item, fields, flatten):
+    """Apply Apify's ``flatten`` and ``fields`` list parameters to ``item``."""
+    if flatten:
+        item = dict(item)
+        for parent in flatten:
+            for key, value in (item.pop(parent, None) or {}).items():
+                item[f"{parent}.{key}"] = value
+    if fields:
+        item = {key: value for key, value in item.items() if key in fields}
+    return item
+
+
+class SyntheticDatasets:
+    """
+    Deterministic actor output: every profile has ``posts_per_profile`` posts
+    over ``sounds_per_profile`` sounds and every sound ``videos_per_sound``
+    videos. The same input always produces the same items.
+    """
+
+    def __init__(self, posts_per_profile, sounds_per_profile, videos_per_sound):
+        self.posts_per_profile = posts_per_profile
+        self.sounds_per_profile = sounds_per_profile
+        self.videos_per_sound = videos_per_sound
+
+    def items(self, actor_id, run_input):
+        if actor_id == TikTokScrapperClient.ACTOR_ID:
+            return [
+                item
+                for profile in run_input.get("profiles", [])
+                for item in self.profile_posts(profile)
+            ]
+        if actor_id == TikTokSoundScraperClient.ACTOR_ID:
+            return [
+                item
+                for music_url in run_input.get("musics", [])
+                for item in self.sound_videos(music_url)
+            ]
+        if actor_id == TikTokVideoDownloadClient.ACTOR_ID:
+            return [
+                self.video_download(start_url["url"])
+                for start_url in run_input.get("startUrls", [])
+            ]
+        raise ValueError(f"No synthetic dataset for actor {actor_id}")
+
+    def profile_posts(self, profile_url):
+        profile_name = profile_url.rstrip("/").split("/")[-1]
+        base = _stable_int(profile_url, 6) * 10**9
+        now = int(time.time())
+        for i in range(self.posts_per_profile):
+            post_id = str(7 * 10**18 + base + i)
+            music_id = str(base + i % self.sounds_per_profile)
+            yield {
+                "id": post_id,
+                "createTime": now - i * 60,
+                "isPinned": False,
+                "text": f"Post {i} of {profile_name} " + "#tag " * 10,
+                "webVideoUrl": f"https://www.tiktok.com/{profile_name}/video/{post_id}",
+                "authorMeta": {"name": profile_name, "fans": 1000, "heart": 5000},
+                "musicMeta": {
+                    "musicName": f"sound {music_id}",
+                    "musicId": music_id,
+                    "musicAuthor": profile_name,
+                },
+                "videoMeta": {"height": 1024, "width": 576, "duration": 15},
+                "hashtags": [{"name": "tag"}] * 10,
+            }
+
+    def sound_videos(self, music_url):
+        music_id = _stable_int(music_url, 12)
+        for i in range(self.videos_per_sound):
+            video_id = str(7 * 10**18 + music_id * 1000 + i)
+            yield {
+                "id": video_id,
+                "text": f"Video {i} with {music_url}",
+                "webVideoUrl": f"https://www.tiktok.com/@author{i}/video/{video_id}",
+                "authorMeta": {"name": f"author{i}", "fans": 10},
+                "videoMeta": {"height": 1024, "width": 576, "duration": 15},
+            }
+
+    def video_download(self, url):
+        video_id = url.rstrip("/").split("/")[-1]
+        return {"video": f"{video_id}.mp4", "url": url, "id": video_id}
+
+
+class FakeApifySDKClient:
+    """
+    In-process replacement for ``apify_client.ApifyClient``. Runs finish after
+    ``run_latency`` seconds and dataset pages take ``page_latency`` seconds.
+    """
+
+    datasets = None
+    run_latency = 0.0
+    page_latency = 0.0
+
+    _runs = {}
+    _items = {}
+    _lock = threading.Lock()
+
+    def __init__(self, token=None):
+        self.token = token
+
+    def actor(self, actor_id):
+        return SimpleNamespace(start=lambda run_input: self._start(actor_id, run_input))
+
+    def run(self, run_id):
+        return SimpleNamespace(
+            wait_for_finish=lambda wait_secs=None: self._wait(run_id, wait_secs)
+        )
+
+    def dataset(self, dataset_id):
+        return SimpleNamespace(
+            list_items=lambda **kwargs: self._list_items(dataset_id, **kwargs)
+        )
+
+    def _start(self, actor_id, run_input):
+        run_id = uuid.uuid4().hex
+        run = {
+            "id": run_id,
+            "actId": actor_id,
+            "status": "RUNNING",
+            "defaultDatasetId": f"dataset-{run_id}",
+            "defaultKeyValueStoreId": f"store-{run_id}",
+            "finishesAt": time.monotonic() + self.run_latency,
+        }
+        with self._lock:
+            self._runs[run_id] = run
+            self._items[run["defaultDatasetId"]] = list(
+                self.datasets.items(actor_id, run_input)
+            )
+        return dict(run)
+
+    def _wait(self, run_id, wait_secs=None):
+        run = self._runs[run_id]
+        remaining = max(run["finishesAt"] - time.monotonic(), 0)
+        if wait_secs is not None and remaining > wait_secs:
+            time.sleep(wait_secs)
+            return dict(run)
+        time.sleep(remaining)
+        run["status"] = "SUCCEEDED"
+        return dict(run)
+
+    def _list_items(
+        self, dataset_id, offset=0, limit=None, fields=None, flatten=None, **kwargs
+    ):
+        time.sleep(self.page_latency)
+        items = self._items[dataset_id][offset : offset + limit if limit else None]
+        return SimpleNamespace(
+            items=[_project(item, fields, flatten) for item in items],
+            offset=offset,
+            limit=limit,
+            count=len(items),
+        )
+
+
+class FakeVideoServer:
+    """
+    Threaded HTTP/1.1 server on localhost answering every GET with a
+    ``video_size`` byte body after ``latency`` seconds.
+    """
+
+    def __init__(self, video_size, latency=0.0):
+        body = os.urandom(min(video_size, 1024 * 1024))
+        body = (body * (video_size // len(body) + 1))[:video_size]
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_GET(self):
+                time.sleep(server.latency)
+                self.send_response(200)
+                self.send_header("Content-Type", "video/mp4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.latency = latency
+        self.httpd = http.server.ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.httpd.daemon_threads = True
+        self.base_url = f"http://127.0.0.1:{self.httpd.server_port}"
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def video_url(self, video_id):
+        return f"{self.base_url}/videos/{video_id}.mp4"
+
+
+def _parse_range(value):
+    """``bytes=<first>-<last>`` as a ``(start, end)`` slice."""
+    first, last = value.split("=")[1].split("-")
+    return int(first), int(last) + 1
+
+
+class _LocalMultipartUpload:
+    def __init__(self, path):
+        self.path = path
+        self.parts = {}
+
+    def Part(self, part_number):
+        def upload(Body):
+            part_path = f"{self.path}.part{part_number}"
+            with open(part_path, "wb") as part:
+                part.write(Body)
+            self.parts[part_number] = part_path
+            return {"ETag": f'"{hashlib.md5(Body).hexdigest()}"'}
+
+        def copy_from(CopySource, CopySourceRange):
+            start, end = _parse_range(CopySourceRange)
+            with open(CopySource["Key"], "rb") as source:
+                source.seek(start)
+                response = upload(source.read(end - start))
+            return {"CopyPartResult": response}
+
+        return SimpleNamespace(upload=upload, copy_from=copy_from)
+
+    def complete(self, MultipartUpload):
+        with open(self.path, "wb") as target:
+            for part in MultipartUpload["Parts"]:
+                part_path = self.parts.pop(part["PartNumber"])
+                with open(part_path, "rb") as source:
+                    target.write(source.read())
+                os.remove(part_path)
+
+    def abort(self):
+        for part_path in self.parts.values():
+            os.remove(part_path)
+        self.parts.clear()
+
+
+class _LocalObject:
+    """The subset of a boto3 ``s3.Object`` used by ``S3MultipartWriter``."""
+
+    bucket_name = "local"
+
+    def __init__(self, path):
+        self.path = path
+        self.key = path
+
+    def get(self, Range=None):
+        with open(self.path, "rb") as source:
+            if Range is None:
+                return {"Body": io.BytesIO(source.read())}
+            start, end = _parse_range(Range)
+            source.seek(start)
+            return {"Body": io.BytesIO(source.read(end - start))}
+
+    def initiate_multipart_upload(self, **kwargs):
+        return _LocalMultipartUpload(self.path)
+
+    def put(self, Body, **kwargs):
+        with open(self.path, "wb") as target:
+            target.write(Body)
+
+
+class LocalMultipartStorage(FileSystemStorage):
+    """
+    Filesystem storage with ``MediaS3Storage.open_multipart_writer`` and
+    ``get_object``, so the S3 upload and copy paths run against local files.
+    """
+
+    def open_multipart_writer(self, name, part_size=None):
+        name = self.get_available_name(name)
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        writer = S3MultipartWriter(
+            _LocalObject(path), part_size or settings.ARCHIVE_UPLOAD_PART_SIZE
+        )
+        writer.name = name
+        return writer
+
+    def put_fileobj(self, name, fileobj):
+        return self.save(name, File(fileobj))
+
+    def get_object(self, name):
+        return _LocalObject(self.path(name))
@@ -0,0 +1,247 @@
+"""
+Offline throughput benchmarks for the crawl pipeline.
+
+Apify, the video CDN and S3 are replaced by the stand-ins in
+``benchmarks.fakes``, so the benchmarks need neither network access nor
+credentials. Run them from the project root::
+
+    python -m benchmarks.run --posts 2000 --sounds 200 --videos-per-sound 10
+
+Every run uses a fresh SQLite database and media directory in a temporary
+directory, whatever ``DATABASE_URL`` is set to; ``--database-url`` runs them
+against another database. With ``APIFY_MODE=record`` the synthetic runs
+are saved as fixtures, with ``APIFY_MODE=replay`` recorded fixtures
+(synthetic or production) are served instead of the fake client.
+"""
+import argparse
+import contextlib
+import os
+import tempfile
+import threading
+import time
+from unittest import mock
+
+BENCHMARK_ENV = {
+    "DJANGO_SETTINGS_MODULE": "tiktokparser.settings",
+    "DJANGO_AWS_ACCESS_KEY_ID": "benchmark",
+    "DJANGO_AWS_SECRET_ACCESS_KEY": "benchmark",
+    "DJANGO_AWS_STORAGE_BUCKET_NAME": "benchmark",
+    "APIFY_API_TOKEN": "benchmark",
+    # Keep the benchmarks independent of Redis
+    "APIFY_RUN_CACHE_TTL": "0",
+    "METRICS_WORKER_PORT": "0",
+    "VIDEO_DOWNLOAD_BATCH_MAX_WAIT": "0.01",
+}
+
+
+class Result:
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.items = 0
+        self.nbytes = 0
+        self.seconds = 0.0
+
+    def __str__(self):
+        per_second = self.items / self.seconds if self.seconds else 0
+        mb_per_second = self.nbytes / self.seconds / 1024**2 if self.seconds else 0
+        return (
+            f"{self.name:<32} {self.calls:>6} {self.items:>9} {self.seconds:>9.2f}"
+            f" {per_second:>10.1f} {mb_per_second:>9.1f}"
+        )
+
+
+class Benchmark:
+    def __init__(self):
+        self.results = {}
+
+    @contextlib.contextmanager
+    def measure(self, name):
+        result = self.results.setdefault(name, Result(name))
+        started = time.perf_counter()
+        try:
+            yield result
+        finally:
+            result.seconds += time.perf_counter() - started
+            result.calls += 1
+
+    def report(self):
+        print(
+            f"{'benchmark':<32} {'calls':>6} {'items':>9} {'seconds':>9}"
+            f" {'items/s':>10} {'MB/s':>9}"
+        )
+        for result in self.results.values():
+            print(result)
+
+
+class LocalSlots:
+    """In-process stand-in for the Redis-backed ``ClusterSemaphore``."""
+
+    def __init__(self, limit):
+        self._semaphore = threading.BoundedSemaphore(limit)
+
+    def acquire(self):
+        self._semaphore.acquire()
+        return "local"
+
+    def release(self, token):
+        self._semaphore.release()
+
+
+def run(options, workdir):
+    from django.conf import settings
+    from django.core.management import call_command
+
+    from benchmarks import fakes
+    from clients import apify
+    from clients.apify_fixtures import APIFY_MODE_REPLAY
+    from tiktokaggregator import tasks
+    from tiktokaggregator.models import MusicPost, Profile, ScrapeJob, VideoPost
+    from tiktokparser.celery import app
+
+    call_command("migrate", verbosity=0)
+    app.conf.task_always_eager = True
+    app.conf.task_eager_propagates = True
+
+    datasets = fakes.SyntheticDatasets(
+        options.posts, options.sounds, options.videos_per_sound
+    )
+    fakes.FakeApifySDKClient.datasets = datasets
+    fakes.FakeApifySDKClient.run_latency = options.run_latency
+    fakes.FakeApifySDKClient.page_latency = options.page_latency
+    storage = fakes.LocalMultipartStorage(location=os.path.join(workdir, "media"))
+    slots = LocalSlots(settings.SOUND_PROCESSING_CONCURRENCY)
+    archive_slots = LocalSlots(settings.ARCHIVE_CONCURRENCY)
+
+    benchmark = Benchmark()
+    with contextlib.ExitStack() as stack:
+        server = stack.enter_context(
+            fakes.FakeVideoServer(options.video_size, options.video_latency)
+        )
+        patches = [
+            mock.patch.object(
+                Profile._meta.get_field("video_archive"), "storage", storage
+            ),
+            mock.patch.object(
+                VideoPost._meta.get_field("video_object"), "storage", storage
+            ),
+            mock.patch.object(tasks, "sound_processing_slots", lambda: slots),
+            mock.patch.object(tasks, "archive_slots", lambda: archive_slots),
+        ]
+        if settings.APIFY_MODE != APIFY_MODE_REPLAY:
+            # Replays are served from APIFY_FIXTURES_DIR instead
+            patches += [
+                mock.patch.object(apify, "ApifySDKClient", fakes.FakeApifySDKClient),
+                mock.patch.object(
+                    apify.TikTokVideoDownloadClient,
+                    "get_download_video_url",
+                    lambda self, video_id: server.video_url(video_id),
+                ),
+            ]
+        for patch in patches:
+            stack.enter_context(patch)
+
+        # Scrape stage only (the former save_posts_in_chunks): sounds are collected, not processed
+        profile = Profile.objects.create(url="https://www.tiktok.com/@benchmark-stages")
+        music_post_ids = []
+        with mock.patch.object(
+            tasks,
+            "dispatch_sound_processing",
+            lambda ids, job_id=None: music_post_ids.extend(ids),
+        ), benchmark.measure("scrape_pipeline") as result:
+            tasks.scrape_pipeline(profile).run(
+                tasks.chunked_generator(
+                    datasets.profile_posts(profile.url),
+                    settings.SCRAPE_PIPELINE_CHUNK_SIZE,
+                )
+            )
+            result.items += options.posts
+
+        for music_post_id in music_post_ids:
+            with benchmark.measure("process_sound_data") as result:
+                tasks.process_sound_data(music_post_id)
+                result.items += VideoPost.objects.filter(
+                    retrieved_from_post_id=music_post_id
+                ).count()
+
+        with benchmark.measure("download_and_archive_videos") as result:
+            result.items += VideoPost.objects.filter(
+                profile=profile,
+                status=VideoPost.STATUS_CREATED,
+            ).count()
+            tasks.download_and_archive_videos(profile)
+        profile.refresh_from_db()
+        result.nbytes += profile.video_archive.size
+
+        # Everything at once, as triggered from the API
+        profile = Profile.objects.create(url="https://www.tiktok.com/@benchmark-e2e")
+        run_input = {"profiles": [profile.url], "resultsPerPage": options.posts}
+        job = ScrapeJob.objects.create(profile=profile, run_input=run_input)
+        with benchmark.measure("process_tiktok_data (end-to-end)") as result:
+            tasks.process_tiktok_data(run_input, str(job.id))
+            result.items += options.posts
+        job.refresh_from_db()
+        profile.refresh_from_db()
+        result.nbytes += profile.video_archive.size if profile.video_archive else 0
+
+    benchmark.report()
+    print(
+        f"end-to-end job: {job.status}, {job.posts_scraped} posts,"
+        f" {job.sounds_processed}/{job.sounds_total} sounds,"
+        f" {job.videos_archived}/{job.videos_found} videos archived"
+    )
+    print(
+        f"totals: {MusicPost.objects.count()} sounds, {VideoPost.objects.count()} videos"
+    )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--posts", type=int, default=1000, help="posts per profile")
+    parser.add_argument("--sounds", type=int, default=100, help="sounds per profile")
+    parser.add_argument("--videos-per-sound", type=int, default=10)
+    parser.add_argument(
+        "--video-size", type=int, default=256 * 1024, help="bytes per fake MP4"
+    )
+    parser.add_argument(
+        "--video-latency", type=float, default=0.0, help="seconds per video request"
+    )
+    parser.add_argument(
+        "--run-latency", type=float, default=0.0, help="seconds per actor run"
+    )
+    parser.add_argument(
+        "--page-latency", type=float, default=0.0, help="seconds per dataset page"
+    )
+    parser.add_argument(
+        "--archive-shards",
+        type=int,
+        default=0,
+        help="split the end-to-end archive into this many shards",
+    )
+    parser.add_argument(
+        "--database-url",
+        help="run against this database instead of a fresh SQLite one",
+    )
+    return parser.parse_args()
+
+
+def main():
+    options = parse_args()
+    with tempfile.TemporaryDirectory(prefix="tiktokparser-benchmark-") as workdir:
+        for name, value in BENCHMARK_ENV.items():
+            os.environ.setdefault(name, value)
+        if options.archive_shards:
+            os.environ["ARCHIVE_SHARD_WORKERS"] = str(options.archive_shards)
+            os.environ["ARCHIVE_SHARD_MIN_VIDEOS"] = "1"
+        os.environ["DATABASE_URL"] = options.database_url or (
+            f"sqlite:///{os.path.join(workdir, 'benchmark.sqlite3')}"
+        )
+
+        import django
+
+        django.setup()
+        run(options, workdir)
+
+
+if __name__ == "__main__":
+    main()
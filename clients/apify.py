@@ -1,22 +1,325 @@
+import json
+import logging
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
 import backoff
 from apify_client import ApifyClient as ApifySDKClient
 from django.conf import settings
+from redis import RedisError
+
+from clients.apify_fixtures import (
+    APIFY_MODE_LIVE,
+    APIFY_MODE_RECORD,
+    APIFY_MODE_REPLAY,
+    ApifyFixtures,
+    ReplayDatasetReader,
+    run_input_digest,
+)
+from tiktokparser.utils.locks import get_redis
+from tiktokparser.utils.metrics import track
+
+logger = logging.getLogger(__name__)
+
+VIDEO_ID_RE = re.compile(r"\d{15,}")
+
+
+def extract_tiktok_video_id(value):
+    match = VIDEO_ID_RE.search(str(value or ""))
+    return match.group(0) if match else None
+
+
+def get_download_item_tiktok_video_id(item):
+    for key in ("id", "url", "webVideoUrl", "video"):
+        tiktok_video_id = extract_tiktok_video_id(item.get(key))
+        if tiktok_video_id:
+            return tiktok_video_id
+
+
+class ApifyRunCache:
+    """
+    Finished actor runs shared by all workers through Redis, keyed by actor id
+    and a hash of the normalized run input. Entries expire after ``ttl``
+    seconds and the oldest ones are evicted beyond ``max_entries``.
+    """
+
+    RUN_FIELDS = ("id", "status", "defaultDatasetId", "defaultKeyValueStoreId")
+
+    def __init__(self, ttl, max_entries, prefix="apify:runs"):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.prefix = prefix
+        self.index_key = f"{prefix}:index"
+
+    def make_key(self, actor_id, run_input):
+        return f"{self.prefix}:{actor_id}:{run_input_digest(run_input)}"
+
+    def get(self, actor_id, run_input):
+        try:
+            cached = get_redis().get(self.make_key(actor_id, run_input))
+        except RedisError as e:
+            logger.warning(f"Apify run cache unavailable: {e}")
+            return None
+        return json.loads(cached) if cached else None
+
+    def set(self, actor_id, run_input, run):
+        key = self.make_key(actor_id, run_input)
+        now = time.time()
+        value = json.dumps({field: run.get(field) for field in self.RUN_FIELDS})
+        try:
+            redis = get_redis()
+            pipeline = redis.pipeline()
+            pipeline.set(key, value, ex=self.ttl)
+            pipeline.zadd(self.index_key, {key: now})
+            pipeline.zremrangebyscore(self.index_key, "-inf", now - self.ttl)
+            pipeline.execute()
+            evicted = redis.zrange(self.index_key, 0, -self.max_entries - 1)
+            if evicted:
+                redis.delete(*evicted)
+                redis.zrem(self.index_key, *evicted)
+        except RedisError as e:
+            logger.warning(f"Apify run cache unavailable: {e}")
+
+
+class ApifyRunError(Exception):
+    pass
+
+
+class ApifyFixtureNotFound(ApifyRunError):
+    pass
+
+
+def dataset_flatten_fields(fields):
+    """Top-level fields Apify has to flatten so nested ``fields`` can be picked."""
+    if not fields:
+        return None
+    return sorted({field.split(".")[0] for field in fields if "." in field}) or None
+
+
+def unflatten_item(item):
+    """Turn ``{"authorMeta.name": ...}`` keys of a flattened item back into dicts."""
+    unflattened = {}
+    for key, value in item.items():
+        *parents, leaf = key.split(".")
+        node = unflattened
+        for parent in parents:
+            node = node.setdefault(parent, {})
+        node[leaf] = value
+    return unflattened
+
+
+class DatasetReader:
+    """
+    Iterates over a dataset page by page. A failed page request is retried from
+    the offset of the last item handed out, so a network error never restarts
+    the dataset from the beginning.
+
+    Only ``fields`` (dotted for nested ones) are requested when given, and the
+    next page is fetched in the background while the current one is consumed.
+    """
+
+    def __init__(
+        self, client, dataset_id, offset=0, page_size=None, fields=None, prefetch=True
+    ):
+        self.client = client
+        self.dataset_id = dataset_id
+        self.offset = offset
+        self.page_size = page_size or settings.APIFY_DATASET_PAGE_SIZE
+        self.fields = fields
+        self.flatten = dataset_flatten_fields(fields)
+        self.prefetch = prefetch
+
+    @backoff.on_exception(backoff.expo, Exception, max_tries=5)
+    def _list_page(self, offset):
+        with track("apify_dataset_page") as tracker:
+            items = (
+                self.client.dataset(self.dataset_id)
+                .list_items(
+                    offset=offset,
+                    limit=self.page_size,
+                    fields=self.fields,
+                    flatten=self.flatten,
+                )
+                .items
+            )
+            tracker.add(items=len(items))
+        if self.flatten:
+            return [unflatten_item(item) for item in items]
+        return items
+
+    def __iter__(self):
+        if not self.prefetch:
+            while True:
+                items = self._list_page(self.offset)
+                for item in items:
+                    self.offset += 1
+                    yield item
+                if len(items) < self.page_size:
+                    return
 
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            next_page = executor.submit(self._list_page, self.offset)
+            while True:
+                items = next_page.result()
+                if len(items) == self.page_size:
+                    next_page = executor.submit(
+                        self._list_page, self.offset + len(items)
+                    )
+                for item in items:
+                    self.offset += 1
+                    yield item
+                if len(items) < self.page_size:
+                    return
+
+
+class ApifyClientMixin:
+    """Mode, run cache and fixture setup shared by the sync and async clients."""
+
+    USE_RUN_CACHE = True
+    # Dataset item fields the caller uses, None reads whole items
+    DATASET_FIELDS = None
+    TERMINAL_STATUSES = ("SUCCEEDED", "FAILED", "TIMED-OUT", "ABORTED")
 
-class BaseApifyClient:
     def __init__(self):
-        self.client = ApifySDKClient(settings.APIFY_API_TOKEN)
+        self.mode = settings.APIFY_MODE
+        self.client = None
+        if self.mode != APIFY_MODE_REPLAY:
+            self.client = self.sdk_client(settings.APIFY_API_TOKEN)
+        self.fixtures = None
+        if self.mode != APIFY_MODE_LIVE:
+            self.fixtures = ApifyFixtures(
+                settings.APIFY_FIXTURES_DIR, settings.APIFY_REPLAY_SPEED
+            )
+        self.run_cache = None
+        use_run_cache = self.USE_RUN_CACHE and self.mode == APIFY_MODE_LIVE
+        if use_run_cache and settings.APIFY_RUN_CACHE_TTL:
+            self.run_cache = ApifyRunCache(
+                settings.APIFY_RUN_CACHE_TTL, settings.APIFY_RUN_CACHE_MAX_ENTRIES
+            )
 
     _run = None
 
+    def sdk_client(self, token):
+        raise NotImplementedError
+
+    def finished_run(self, run_id, run):
+        """Return ``run`` if it succeeded, raise if it is still going or failed."""
+        if run is None or run["status"] not in self.TERMINAL_STATUSES:
+            raise ConnectionError(f"Run {run_id} is still running, reattaching")
+        if run["status"] != "SUCCEEDED":
+            raise ApifyRunError(f"Run {run_id} finished with status {run['status']}")
+        return run
+
+
+class BaseApifyClient(ApifyClientMixin):
+    # How often ``on_wait`` is called while a run is still going
+    WAIT_INTERVAL = 60
+
+    def sdk_client(self, token):
+        return ApifySDKClient(token)
+
     @backoff.on_exception(backoff.expo, Exception, max_tries=5)
-    def run_actor(self, actor_id, run_input):
-        self._run = self.client.actor(actor_id).call(run_input=run_input)
-        return self.client.dataset(self._run["defaultDatasetId"]).iterate_items()
+    def start_run(self, actor_id, run_input):
+        return self.client.actor(actor_id).start(run_input=run_input)
+
+    @backoff.on_exception(
+        backoff.expo,
+        Exception,
+        max_tries=5,
+        giveup=lambda e: isinstance(e, ApifyRunError),
+    )
+    def wait_for_run(self, run_id, on_wait=None):
+        """
+        Wait for an already started run, reattaching to it after transient
+        errors. ``on_wait(run)`` is called every ``WAIT_INTERVAL`` seconds
+        the run is still going.
+        """
+        wait_secs = self.WAIT_INTERVAL if on_wait else None
+        while True:
+            run = self.client.run(run_id).wait_for_finish(wait_secs=wait_secs)
+            if not on_wait or run is None or run["status"] in self.TERMINAL_STATUSES:
+                break
+            on_wait(run)
+        return self.finished_run(run_id, run)
+
+    def run_actor(self, actor_id, run_input, on_run=None, on_wait=None):
+        """
+        Run ``actor_id`` and return a reader over its dataset. ``on_run(run)``
+        is called as soon as the run is known, before waiting for it, and
+        ``on_wait(run)`` while waiting for it (see ``wait_for_run``).
+
+        In record mode the run and the items read from it are also saved as a
+        fixture; in replay mode they are served from one without calling Apify.
+        """
+        if self.mode == APIFY_MODE_REPLAY:
+            return self.replay_run(self.fixtures.run_path(actor_id, run_input), on_run)
+
+        started = time.monotonic()
+        self._run = self.run_cache and self.run_cache.get(actor_id, run_input)
+        if self._run:
+            logger.info(f"Reusing cached run {self._run['id']} of actor {actor_id}")
+            if on_run:
+                on_run(self._run)
+        else:
+            with track("apify_actor_run") as tracker:
+                self._run = self.start_run(actor_id, run_input)
+                if on_run:
+                    on_run(self._run)
+                self._run = self.wait_for_run(self._run["id"], on_wait)
+                tracker.add(items=1)
+            if self.run_cache:
+                self.run_cache.set(actor_id, run_input, self._run)
+        reader = self.read_dataset(self._run["defaultDatasetId"])
+        if self.mode == APIFY_MODE_RECORD:
+            return self.fixtures.record_run(
+                actor_id,
+                run_input,
+                self._run,
+                time.monotonic() - started,
+                self.record_items(reader),
+            )
+        return reader
+
+    def resume_run(self, run_id, offset=0, on_wait=None):
+        """Reattach to a run started earlier and read its dataset from ``offset``."""
+        if self.mode == APIFY_MODE_REPLAY:
+            return self.replay_run(self.fixtures.find_run(run_id), offset=offset)
+        self._run = self.wait_for_run(run_id, on_wait)
+        return self.read_dataset(self._run["defaultDatasetId"], offset=offset)
+
+    def replay_run(self, path, on_run=None, offset=0):
+        if path is None or not path.exists():
+            raise ApifyFixtureNotFound(f"No recorded run at {path}")
+        header, lines = self.fixtures.load_run(path)
+        self._run = header["run"]
+        if on_run:
+            on_run(self._run)
+        if not offset:
+            time.sleep(self.fixtures.run_delay(header))
+        return ReplayDatasetReader(self.fixtures, lines, offset=offset)
+
+    def record_items(self, items):
+        """Hook for saving what dataset items point to while they are recorded."""
+        return items
+
+    def read_dataset(self, dataset_id, offset=0):
+        return DatasetReader(
+            self.client, dataset_id, offset=offset, fields=self.DATASET_FIELDS
+        )
 
 
 class TikTokScrapperClient(BaseApifyClient):
     ACTOR_ID = "GdWCkxBtKWOsKjdch"
+    DATASET_FIELDS = [
+        "id",
+        "createTime",
+        "isPinned",
+        "text",
+        "authorMeta.name",
+        "musicMeta.musicName",
+        "musicMeta.musicId",
+    ]
 
     def run(self, run_input):
         return self.run_actor(self.ACTOR_ID, run_input)
@@ -24,22 +327,57 @@ class TikTokScrapperClient(BaseApifyClient):
 
 class TikTokSoundScraperClient(BaseApifyClient):
     ACTOR_ID = "JVisUAY6oGn2dBn99"
+    DATASET_FIELDS = ["id", "text", "authorMeta.name", "webVideoUrl"]
 
     def run(self, run_input):
         return self.run_actor(self.ACTOR_ID, run_input)
 
 
-class TikTokVideoDownloadClient(BaseApifyClient):
+class VideoDownloadClientMixin:
+    """Video download actor details shared by the sync and async clients."""
+
     ACTOR_ID = "5AnFmBqPofhuiqvaf"
+    DATASET_FIELDS = ["id", "url", "webVideoUrl", "video"]
     STORAGE_ID = None
 
-    def run(self, run_input):
-        run_generator = self.run_actor(self.ACTOR_ID, run_input)
-        self.STORAGE_ID = self._run["defaultKeyValueStoreId"]
-        return run_generator
+    def record_items(self, items):
+        # The downloaded videos are key-value store records, replays need them
+        # too. Items are also indexed by video since batches are not repeatable.
+        for item in items:
+            download_video_id = item["video"].split(".mp4")[0]
+            self.fixtures.record_kv_record(
+                download_video_id, self.get_download_video_url(download_video_id)
+            )
+            tiktok_video_id = get_download_item_tiktok_video_id(item)
+            if tiktok_video_id:
+                self.fixtures.record_item("downloads", tiktok_video_id, item)
+            yield item
+
+    def replay_downloads(self, run_input):
+        """Serve the recorded download of every start URL, whatever the batch."""
+        for start_url in run_input["startUrls"]:
+            tiktok_video_id = extract_tiktok_video_id(start_url["url"])
+            item = tiktok_video_id and self.fixtures.load_item(
+                "downloads", tiktok_video_id
+            )
+            if not item:
+                logger.warning(f"No recorded download for {start_url['url']}")
+                continue
+            yield item
 
     def get_download_video_url(self, video_id):
+        if self.mode == APIFY_MODE_REPLAY:
+            return self.fixtures.kv_record_path(video_id).as_uri()
         return (
             f"https://api.apify.com/v2/key-value-stores"
             f"/{self.STORAGE_ID}/records/{video_id}"
         )
+
+
+class TikTokVideoDownloadClient(VideoDownloadClientMixin, BaseApifyClient):
+    def run(self, run_input):
+        if self.mode == APIFY_MODE_REPLAY:
+            return self.replay_downloads(run_input)
+        run_generator = self.run_actor(self.ACTOR_ID, run_input)
+        self.STORAGE_ID = self._run["defaultKeyValueStoreId"]
+        return run_generator
@@ -0,0 +1,184 @@
+import asyncio
+import logging
+
+import backoff
+from apify_client import ApifyClientAsync as ApifySDKClientAsync
+from django.conf import settings
+
+from clients.apify import (
+    ApifyClientMixin,
+    ApifyFixtureNotFound,
+    ApifyRunError,
+    TikTokScrapperClient,
+    TikTokSoundScraperClient,
+    VideoDownloadClientMixin,
+    dataset_flatten_fields,
+    unflatten_item,
+)
+from clients.apify_fixtures import (
+    APIFY_MODE_RECORD,
+    APIFY_MODE_REPLAY,
+    ReplayDatasetReader,
+)
+from tiktokparser.utils.metrics import track
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncDatasetReader:
+    """Async counterpart of ``DatasetReader``, usable with ``async for``."""
+
+    def __init__(self, client, dataset_id, offset=0, page_size=None, fields=None):
+        self.client = client
+        self.dataset_id = dataset_id
+        self.offset = offset
+        self.page_size = page_size or settings.APIFY_DATASET_PAGE_SIZE
+        self.fields = fields
+        self.flatten = dataset_flatten_fields(fields)
+
+    @backoff.on_exception(backoff.expo, Exception, max_tries=5)
+    async def _list_page(self, offset):
+        with track("apify_dataset_page") as tracker:
+            page = await self.client.dataset(self.dataset_id).list_items(
+                offset=offset,
+                limit=self.page_size,
+                fields=self.fields,
+                flatten=self.flatten,
+            )
+            tracker.add(items=len(page.items))
+        if self.flatten:
+            return [unflatten_item(item) for item in page.items]
+        return page.items
+
+    async def __aiter__(self):
+        next_page = asyncio.create_task(self._list_page(self.offset))
+        try:
+            while True:
+                items = await next_page
+                if len(items) == self.page_size:
+                    next_page = asyncio.create_task(
+                        self._list_page(self.offset + len(items))
+                    )
+                for item in items:
+                    self.offset += 1
+                    yield item
+                if len(items) < self.page_size:
+                    return
+        finally:
+            next_page.cancel()
+
+
+class AsyncReplayDatasetReader(ReplayDatasetReader):
+    async def __aiter__(self):
+        for delay, item in self.fixtures.replay_items(self.lines, self.offset):
+            if delay:
+                await asyncio.sleep(delay)
+            self.offset += 1
+            yield item
+
+
+class AsyncBaseApifyClient(ApifyClientMixin):
+    """
+    asyncio version of ``BaseApifyClient``. Waiting on a run does not hold a
+    thread, so a single worker can drive many actor runs at once.
+    """
+
+    def __init__(self):
+        super().__init__()
+        if self.mode == APIFY_MODE_RECORD:
+            logger.warning("Record mode is only supported by the sync Apify clients")
+
+    def sdk_client(self, token):
+        return ApifySDKClientAsync(token)
+
+    @backoff.on_exception(backoff.expo, Exception, max_tries=5)
+    async def start_run(self, actor_id, run_input):
+        return await self.client.actor(actor_id).start(run_input=run_input)
+
+    @backoff.on_exception(
+        backoff.expo,
+        Exception,
+        max_tries=5,
+        giveup=lambda e: isinstance(e, ApifyRunError),
+    )
+    async def wait_for_run(self, run_id):
+        run = await self.client.run(run_id).wait_for_finish()
+        return self.finished_run(run_id, run)
+
+    async def run_actor(self, actor_id, run_input, on_run=None):
+        """
+        Run ``actor_id`` and return a reader over its dataset. ``on_run(run)``
+        is awaited as soon as the run is known, before waiting for it.
+        """
+        if self.mode == APIFY_MODE_REPLAY:
+            return await self.replay_run(
+                self.fixtures.run_path(actor_id, run_input), on_run
+            )
+        self._run = None
+        if self.run_cache:
+            self._run = await asyncio.to_thread(self.run_cache.get, actor_id, run_input)
+        if self._run:
+            logger.info(f"Reusing cached run {self._run['id']} of actor {actor_id}")
+            if on_run:
+                await on_run(self._run)
+        else:
+            with track("apify_actor_run") as tracker:
+                self._run = await self.start_run(actor_id, run_input)
+                if on_run:
+                    await on_run(self._run)
+                self._run = await self.wait_for_run(self._run["id"])
+                tracker.add(items=1)
+            if self.run_cache:
+                await asyncio.to_thread(
+                    self.run_cache.set, actor_id, run_input, self._run
+                )
+        return self.read_dataset(self._run["defaultDatasetId"])
+
+    async def resume_run(self, run_id, offset=0):
+        """Reattach to a run started earlier and read its dataset from ``offset``."""
+        if self.mode == APIFY_MODE_REPLAY:
+            path = await asyncio.to_thread(self.fixtures.find_run, run_id)
+            return await self.replay_run(path, offset=offset)
+        self._run = await self.wait_for_run(run_id)
+        return self.read_dataset(self._run["defaultDatasetId"], offset=offset)
+
+    async def replay_run(self, path, on_run=None, offset=0):
+        if path is None or not path.exists():
+            raise ApifyFixtureNotFound(f"No recorded run at {path}")
+        header, lines = await asyncio.to_thread(self.fixtures.load_run, path)
+        self._run = header["run"]
+        if on_run:
+            await on_run(self._run)
+        if not offset:
+            await asyncio.sleep(self.fixtures.run_delay(header))
+        return AsyncReplayDatasetReader(self.fixtures, lines, offset=offset)
+
+    def read_dataset(self, dataset_id, offset=0):
+        return AsyncDatasetReader(
+            self.client, dataset_id, offset=offset, fields=self.DATASET_FIELDS
+        )
+
+    async def run(self, run_input):
+        return await self.run_actor(self.ACTOR_ID, run_input)
+
+
+class AsyncTikTokScrapperClient(AsyncBaseApifyClient):
+    ACTOR_ID = TikTokScrapperClient.ACTOR_ID
+    DATASET_FIELDS = TikTokScrapperClient.DATASET_FIELDS
+
+
+class AsyncTikTokSoundScraperClient(AsyncBaseApifyClient):
+    ACTOR_ID = TikTokSoundScraperClient.ACTOR_ID
+    DATASET_FIELDS = TikTokSoundScraperClient.DATASET_FIELDS
+
+
+class AsyncTikTokVideoDownloadClient(VideoDownloadClientMixin, AsyncBaseApifyClient):
+    async def run(self, run_input):
+        if self.mode == APIFY_MODE_REPLAY:
+            items = self.replay_downloads(run_input)
+            return AsyncReplayDatasetReader(
+                self.fixtures, [(0, item) for item in items]
+            )
+        reader = await self.run_actor(self.ACTOR_ID, run_input)
+        self.STORAGE_ID = self._run["defaultKeyValueStoreId"]
+        return reader
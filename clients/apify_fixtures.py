@@ -0,0 +1,142 @@
+import hashlib
+import json
+import logging
+import os
+import time
+from pathlib import Path
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+APIFY_MODE_LIVE = "live"
+APIFY_MODE_RECORD = "record"
+APIFY_MODE_REPLAY = "replay"
+
+
+def run_input_digest(run_input):
+    normalized = json.dumps(
+        run_input, sort_keys=True, separators=(",", ":"), default=str
+    )
+    return hashlib.sha256(normalized.encode()).hexdigest()
+
+
+class ApifyFixtures:
+    """
+    Actor runs and key-value store records saved on disk for offline replay.
+
+    Every run is one JSONL file, ``runs/<actor id>/<run input digest>.jsonl``:
+    a header line with the actor id, run input, run and how long the run took,
+    then one line per dataset item with the seconds since the run started
+    when it was read. Key-value store records are kept as plain files under
+    ``kv/<key>`` and single items can be indexed under ``items/<kind>/<key>.json``.
+
+    Replays are paced at ``speed`` times the recorded speed; a speed of 0
+    serves everything as fast as possible.
+    """
+
+    def __init__(self, directory, speed=0):
+        self.directory = Path(directory)
+        self.speed = speed
+
+    def run_path(self, actor_id, run_input):
+        return (
+            self.directory / "runs" / actor_id / f"{run_input_digest(run_input)}.jsonl"
+        )
+
+    def find_run(self, run_id):
+        for path in self.directory.glob("runs/*/*.jsonl"):
+            with open(path) as fixture:
+                if json.loads(fixture.readline())["run"]["id"] == run_id:
+                    return path
+
+    def kv_record_path(self, key):
+        return (self.directory / "kv" / key).resolve()
+
+    def item_path(self, kind, key):
+        return self.directory / "items" / kind / f"{key}.json"
+
+    def record_run(self, actor_id, run_input, run, duration, items):
+        """Yield ``items`` while writing them and the run header to a fixture."""
+        path = self.run_path(actor_id, run_input)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        partial_path = path.with_suffix(f".{os.getpid()}.partial")
+        started = time.monotonic()
+        header = {
+            "actor_id": actor_id,
+            "run_input": run_input,
+            "run": run,
+            "duration": duration,
+        }
+        try:
+            with open(partial_path, "w") as fixture:
+                fixture.write(json.dumps(header, default=str) + "\n")
+                for item in items:
+                    line = {
+                        "elapsed": round(time.monotonic() - started, 3),
+                        "item": item,
+                    }
+                    fixture.write(json.dumps(line, default=str) + "\n")
+                    yield item
+        finally:
+            # Whatever was read gets saved, a replay reads the same items
+            os.replace(partial_path, path)
+            logger.info(f"Recorded run {run['id']} of actor {actor_id} to {path}")
+
+    def record_item(self, kind, key, item):
+        path = self.item_path(kind, key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(item, default=str))
+
+    def load_item(self, kind, key):
+        path = self.item_path(kind, key)
+        return json.loads(path.read_text()) if path.exists() else None
+
+    def record_kv_record(self, key, url):
+        path = self.kv_record_path(key)
+        if path.exists():
+            return
+        path.parent.mkdir(parents=True, exist_ok=True)
+        partial_path = path.with_suffix(f".{os.getpid()}.partial")
+        with requests.get(url, stream=True, timeout=60) as response:
+            response.raise_for_status()
+            with open(partial_path, "wb") as record:
+                for chunk in response.iter_content(chunk_size=1024 * 1024):
+                    record.write(chunk)
+        os.replace(partial_path, path)
+
+    def load_run(self, path):
+        """Return the recorded run header and its ``(elapsed, item)`` lines."""
+        with open(path) as fixture:
+            header = json.loads(fixture.readline())
+            lines = [json.loads(line) for line in fixture]
+        return header, [(line["elapsed"], line["item"]) for line in lines]
+
+    def run_delay(self, header):
+        return header["duration"] / self.speed if self.speed else 0
+
+    def replay_items(self, lines, offset=0):
+        """Yield ``(delay, item)`` for the items from ``offset`` on, paced by speed."""
+        started = time.monotonic()
+        skipped = lines[min(offset, len(lines)) - 1][0] if offset and lines else 0
+        for elapsed, item in lines[offset:]:
+            delay = 0
+            if self.speed:
+                delay = (elapsed - skipped) / self.speed - (time.monotonic() - started)
+            yield max(delay, 0), item
+
+
+class ReplayDatasetReader:
+    """Serves a recorded dataset, counting ``offset`` like ``DatasetReader``."""
+
+    def __init__(self, fixtures, lines, offset=0):
+        self.fixtures = fixtures
+        self.lines = lines
+        self.offset = offset
+
+    def __iter__(self):
+        for delay, item in self.fixtures.replay_items(self.lines, self.offset):
+            if delay:
+                time.sleep(delay)
+            self.offset += 1
+            yield item
@@ -1,9 +1,11 @@
+import datetime
 import logging
 
 from django.contrib import admin, messages
+from django.template.defaultfilters import filesizeformat
 
-from .models import MusicPost, Profile, VideoPost
-from .tasks import download_and_archive_videos
+from .models import MusicPost, Profile, ScrapeJob, VideoPost
+from .tasks import archive_profile_videos
 
 logger = logging.getLogger(__name__)
 
@@ -35,14 +37,16 @@ class VideoPostAdmin(admin.ModelAdmin):
     list_display = (
         "id",
         "retrieved_from_post",
+        "profile",
         "download_video_id",
         "download_video_url",
+        "video_object",
         "status",
         "created_at",
         "updated_at",
     )
     list_filter = ("created_at", "updated_at", "status")
-    search_fields = ("retrieved_from_post__author",)
+    search_fields = ("retrieved_from_post__author", "profile__url")
     readonly_fields = ("id", "created_at", "updated_at")
 
     def get_readonly_fields(self, request, obj=None):
@@ -51,22 +55,92 @@ class VideoPostAdmin(admin.ModelAdmin):
 
 @admin.register(Profile)
 class ProfileAdmin(admin.ModelAdmin):
-    list_display = ("id", "url", "video_archive")
+    list_display = (
+        "id",
+        "url",
+        "archive_status",
+        "archive_progress",
+        "archive_eta_display",
+        "video_archive",
+    )
+    list_filter = ("archive_status",)
+    readonly_fields = (
+        "archive_status",
+        "archive_error",
+        "archive_started_at",
+        "archive_videos_total",
+        "archive_videos_done",
+        "archive_bytes",
+    )
     actions = ["archive_videos"]
 
-    @admin.action(description="Download and Archive Videos for selected MusicPosts")
+    @admin.display(description="Archive progress")
+    def archive_progress(self, obj):
+        if obj.archive_status == Profile.ARCHIVE_IDLE:
+            return "-"
+        return (
+            f"{obj.archive_videos_done}/{obj.archive_videos_total} videos,"
+            f" {filesizeformat(obj.archive_bytes)}"
+        )
+
+    @admin.display(description="ETA")
+    def archive_eta_display(self, obj):
+        eta = obj.archive_eta
+        if eta is None:
+            return "-"
+        return str(datetime.timedelta(seconds=int(eta.total_seconds())))
+
+    @admin.action(description="Download and archive videos of the selected profiles")
     def archive_videos(self, request, queryset):
-        logger.info(queryset)
-        try:
-            download_and_archive_videos(queryset[0])
+        queued = []
+        skipped = []
+        for profile in queryset:
+            # Claimed before queueing so a second click can't start a duplicate archive
+            if not Profile.queue_archive(profile.pk):
+                skipped.append(profile)
+                continue
+            try:
+                archive_profile_videos.delay(str(profile.pk))
+            except Exception as e:
+                logger.exception(f"Failed to queue archive for profile {profile}")
+                Profile.set_archive_status(
+                    profile.pk, Profile.ARCHIVE_FAILED, archive_error=str(e)
+                )
+                self.message_user(
+                    request,
+                    f"Error queueing archive for {profile}: {e}",
+                    messages.ERROR,
+                )
+                continue
+            queued.append(profile)
+        if queued:
             self.message_user(
                 request,
-                f"Successfully archived videos for {queryset[0]}",
+                f"Queued archives for {len(queued)} profile(s)",
                 messages.SUCCESS,
             )
-        except Exception as e:
+        if skipped:
             self.message_user(
                 request,
-                f"Error archiving videos for {queryset[0]}: {e}",
-                messages.ERROR,
+                f"Already being archived: {', '.join(str(profile) for profile in skipped)}",
+                messages.WARNING,
             )
+
+
+@admin.register(ScrapeJob)
+class ScrapeJobAdmin(admin.ModelAdmin):
+    list_display = (
+        "id",
+        "profile",
+        "status",
+        "posts_scraped",
+        "sounds_total",
+        "sounds_processed",
+        "videos_found",
+        "videos_archived",
+        "created_at",
+        "updated_at",
+    )
+    list_filter = ("status", "created_at")
+    search_fields = ("profile__url",)
+    readonly_fields = [f.name for f in ScrapeJob._meta.fields]
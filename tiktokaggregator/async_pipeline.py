@@ -0,0 +1,319 @@
+import asyncio
+import logging
+from collections import deque
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+
+from clients.apify import ApifyRunError, get_download_item_tiktok_video_id
+from clients.apify_async import (
+    AsyncTikTokSoundScraperClient,
+    AsyncTikTokVideoDownloadClient,
+)
+from tiktokparser.utils.metrics import count_profile
+
+from .models import MusicPost, ScrapeJob, VideoPost
+from .tasks import (
+    complete_sound,
+    drop_known_videos,
+    filter_video_posts,
+    get_existing_tiktok_video_ids,
+    normalize_video_url,
+    process_sound_tiktok_results,
+    sound_scraper_run_input,
+    start_archive_when_sounds_done,
+)
+
+logger = logging.getLogger(__name__)
+
+
+async def achunked(iterator, chunk_size):
+    """Yield successive chunks from an async iterator."""
+    chunk = []
+    async for item in iterator:
+        chunk.append(item)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+@sync_to_async
+def start_sound(music_post_id):
+    try:
+        music_post = MusicPost.objects.select_related("profile_url").get(
+            id=music_post_id
+        )
+    except MusicPost.DoesNotExist:
+        return None
+    if music_post.status in (MusicPost.STATUS_FINISHED, MusicPost.STATUS_FAILED):
+        return music_post  # Redelivered after it was already completed
+    music_post.save_checkpoint(status=MusicPost.STATUS_PENDING)
+    return music_post
+
+
+@sync_to_async
+def save_checkpoint(music_post, **fields):
+    music_post.save_checkpoint(**fields)
+
+
+@sync_to_async
+def refresh_heartbeats(music_post_ids):
+    MusicPost.objects.filter(
+        id__in=music_post_ids, status=MusicPost.STATUS_PENDING
+    ).update(sound_heartbeat_at=timezone.now())
+
+
+async def start_sound_run(client, music_post):
+    """Reattach to the checkpointed sound scraper run or start a new one."""
+    if music_post.sound_run_id:
+        try:
+            reader = await client.resume_run(
+                music_post.sound_run_id, offset=music_post.sound_dataset_offset
+            )
+            logger.info(
+                f"Resuming {music_post} at offset {music_post.sound_dataset_offset}"
+            )
+            return reader
+        except ApifyRunError:
+            logger.warning(f"Checkpointed run of {music_post} failed, starting over")
+    await save_checkpoint(music_post, sound_run_id=None, sound_dataset_offset=0)
+    return await client.run_actor(
+        client.ACTOR_ID,
+        sound_scraper_run_input(music_post),
+        on_run=lambda run: save_checkpoint(music_post, sound_run_id=run["id"]),
+    )
+
+
+@sync_to_async
+def filter_known_videos(processed_chunk):
+    return drop_known_videos(processed_chunk)
+
+
+@sync_to_async
+def save_video_posts(video_posts, job_id):
+    filtered_video_ids = set(
+        filter_video_posts(
+            [video_post.download_video_id for video_post in video_posts],
+            get_existing_tiktok_video_ids(
+                video_post.download_video_id for video_post in video_posts
+            ),
+        )
+    )
+    created_video_posts = VideoPost.objects.bulk_create_new(
+        video_post
+        for video_post in video_posts
+        if video_post.download_video_id in filtered_video_ids
+    )
+    ScrapeJob.advance(job_id, videos_found=len(created_video_posts))
+    for video_post in created_video_posts:
+        count_profile(video_post.retrieved_from_post.profile_url, "videos", 1)
+    return created_video_posts
+
+
+@sync_to_async
+def finish_sound(music_post_id, status, job_id):
+    # A sound that no longer exists (status None) still counts as processed
+    if status is None or complete_sound(music_post_id, status):
+        ScrapeJob.advance(job_id, sounds_processed=1)
+        start_archive_when_sounds_done(job_id)
+
+
+class _Chunk:
+    """A chunk of a sound's dataset, resolved once all its videos are."""
+
+    def __init__(self, end_offset, size):
+        self.end_offset = end_offset
+        self.pending = size
+        self.failed = False
+        self.done = asyncio.Event()
+        if not size:
+            self.done.set()
+
+    def resolve(self, failed=False):
+        self.failed |= failed
+        self.pending -= 1
+        if not self.pending:
+            self.done.set()
+
+
+class AsyncSoundPipeline:
+    """
+    Processes many sounds from one event loop in two stages.
+
+    Sound scraper runs are started and streamed concurrently (at most
+    ``SOUND_PROCESSING_ASYNC_CONCURRENCY`` at a time); their new video URLs go
+    through a bounded queue to the download stage, which batches them into
+    ``VIDEO_DOWNLOAD_BATCH_SIZE`` video-download runs, at most
+    ``VIDEO_DOWNLOAD_ASYNC_CONCURRENCY`` in flight.
+
+    Like ``process_sound_data``, every sound checkpoints its run and the
+    dataset offset of the chunks whose videos are saved, and the heartbeat of
+    the sounds in progress is refreshed so they are not resumed elsewhere.
+    """
+
+    def __init__(self, job_id=None, chunk_size=500):
+        self.job_id = job_id
+        self.chunk_size = chunk_size
+        self.queue = asyncio.Queue(maxsize=settings.VIDEO_DOWNLOAD_BATCH_SIZE * 2)
+        self.sound_slots = asyncio.Semaphore(
+            settings.SOUND_PROCESSING_ASYNC_CONCURRENCY
+        )
+        self.download_slots = asyncio.Semaphore(
+            settings.VIDEO_DOWNLOAD_ASYNC_CONCURRENCY
+        )
+        self.failed_sounds = set()
+        self.active_sounds = set()
+
+    async def run(self, music_post_ids):
+        download_stage = asyncio.create_task(self.resolve_downloads())
+        heartbeat = asyncio.create_task(self.refresh_heartbeats())
+        try:
+            music_posts = await asyncio.gather(
+                *(self.scrape_sound(music_post_id) for music_post_id in music_post_ids)
+            )
+            await self.queue.put(None)
+            await download_stage
+        finally:
+            heartbeat.cancel()
+
+        for music_post_id, music_post in zip(music_post_ids, music_posts):
+            if music_post is None:
+                status = None
+            elif music_post.status != MusicPost.STATUS_PENDING:
+                continue  # Already completed by an earlier delivery
+            elif music_post.id in self.failed_sounds:
+                status = MusicPost.STATUS_FAILED
+            else:
+                status = MusicPost.STATUS_FINISHED
+            await finish_sound(music_post_id, status, self.job_id)
+
+    async def refresh_heartbeats(self):
+        while True:
+            await asyncio.sleep(settings.SOUND_PROCESSING_STALE_AFTER / 3)
+            if self.active_sounds:
+                await refresh_heartbeats(list(self.active_sounds))
+
+    async def scrape_sound(self, music_post_id):
+        async with self.sound_slots:
+            music_post = await start_sound(music_post_id)
+            if music_post is None or music_post.status != MusicPost.STATUS_PENDING:
+                return music_post
+            self.active_sounds.add(music_post.id)
+            chunks = deque()
+            try:
+                client = AsyncTikTokSoundScraperClient()
+                reader = await start_sound_run(client, music_post)
+                offset = music_post.sound_dataset_offset
+                async for raw_chunk in achunked(reader, self.chunk_size):
+                    processed_chunk = await filter_known_videos(
+                        process_sound_tiktok_results(raw_chunk)
+                    )
+                    offset += len(raw_chunk)
+                    chunk = _Chunk(offset, len(processed_chunk))
+                    chunks.append(chunk)
+                    for item in processed_chunk:
+                        await self.queue.put((music_post, item, chunk))
+                    await self.checkpoint(music_post, chunks)
+            except Exception:
+                logger.exception(
+                    f"Failed to process sound for MusicPost {music_post_id}"
+                )
+                self.failed_sounds.add(music_post.id)
+                chunks.clear()
+        # Waited for outside the slot, the download stage saves them
+        for chunk in chunks:
+            await chunk.done.wait()
+        await self.checkpoint(music_post, chunks)
+        self.active_sounds.discard(music_post.id)
+        return music_post
+
+    async def checkpoint(self, music_post, chunks):
+        """Advance the dataset offset past the chunks whose videos are saved."""
+        offset = None
+        while chunks and chunks[0].done.is_set() and not chunks[0].failed:
+            offset = chunks.popleft().end_offset
+        if offset is not None:
+            await save_checkpoint(music_post, sound_dataset_offset=offset)
+
+    async def resolve_downloads(self):
+        loop = asyncio.get_running_loop()
+        batch_tasks, batch, deadline = [], [], None
+        finished = False
+        while not finished:
+            timeout = None if deadline is None else max(deadline - loop.time(), 0)
+            try:
+                entry = await asyncio.wait_for(self.queue.get(), timeout)
+            except asyncio.TimeoutError:
+                timed_out = True
+            else:
+                timed_out = False
+                finished = entry is None
+                if not finished:
+                    batch.append(entry)
+                    if deadline is None:
+                        deadline = loop.time() + settings.VIDEO_DOWNLOAD_BATCH_MAX_WAIT
+            full = len(batch) >= settings.VIDEO_DOWNLOAD_BATCH_SIZE
+            if batch and (timed_out or finished or full):
+                await self.download_slots.acquire()
+                batch_tasks.append(asyncio.create_task(self.resolve_batch(batch)))
+                batch, deadline = [], None
+        await asyncio.gather(*batch_tasks)
+
+    async def resolve_batch(self, batch):
+        try:
+            music_posts_by_url = {
+                normalize_video_url(item["tiktok_video_url"]): music_post
+                for music_post, item, _ in batch
+            }
+            urls = {item["tiktok_video_url"] for _, item, _ in batch}
+            single_sound = len({music_post.id for music_post, _, _ in batch}) == 1
+
+            client = AsyncTikTokVideoDownloadClient()
+            reader = await client.run(
+                {
+                    "startUrls": [{"url": url} for url in urls],
+                    "proxy": {"useApifyProxy": True},
+                }
+            )
+            video_posts = []
+            async for item in reader:
+                download_video_id = item["video"].split(".mp4")[0]
+                tiktok_video_id = get_download_item_tiktok_video_id(item)
+                # Routed by the start URL the actor echoes, as in the sync path
+                music_post = music_posts_by_url.get(
+                    normalize_video_url(item.get("url") or item.get("webVideoUrl"))
+                )
+                if single_sound:
+                    music_post = batch[0][0]
+                if music_post is None:
+                    logger.warning(f"Could not route downloaded video {item}")
+                    continue
+                video_posts.append(
+                    VideoPost(
+                        retrieved_from_post=music_post,
+                        profile_id=music_post.profile_url_id,
+                        download_video_id=download_video_id,
+                        download_video_url=client.get_download_video_url(
+                            download_video_id
+                        ),
+                        tiktok_video_id=tiktok_video_id,
+                    )
+                )
+            created_video_posts = await save_video_posts(video_posts, self.job_id)
+            logger.info(f"{len(created_video_posts)} new videos saved from a batch")
+            failed = False
+        except Exception:
+            logger.exception("Failed to resolve a batch of video downloads")
+            self.failed_sounds.update(music_post.id for music_post, _, _ in batch)
+            failed = True
+        finally:
+            self.download_slots.release()
+        for _, _, chunk in batch:
+            chunk.resolve(failed)
+
+
+async def process_sounds_async(music_post_ids, job_id=None):
+    await AsyncSoundPipeline(job_id=job_id).run(music_post_ids)
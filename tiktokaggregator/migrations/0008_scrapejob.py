@@ -0,0 +1,34 @@
+# Generated by Django 3.2.8 on 2026-10-18 09:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tiktokaggregator', '0007_auto_20240126_1814'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScrapeJob',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('status', models.CharField(choices=[('queued', 'queued'), ('scraping', 'scraping'), ('archiving', 'archiving'), ('finished', 'finished'), ('failed', 'failed')], db_index=True, default='queued', max_length=10)),
+                ('run_input', models.JSONField(default=dict)),
+                ('error', models.TextField(blank=True, default='')),
+                ('posts_scraped', models.PositiveIntegerField(default=0)),
+                ('sounds_processed', models.PositiveIntegerField(default=0)),
+                ('videos_found', models.PositiveIntegerField(default=0)),
+                ('videos_archived', models.PositiveIntegerField(default=0)),
+                ('profile', models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, to='tiktokaggregator.profile')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
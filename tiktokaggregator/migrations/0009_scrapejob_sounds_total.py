@@ -0,0 +1,23 @@
+# Generated by Django 3.2.8 on 2026-10-18 09:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tiktokaggregator', '0008_scrapejob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='scrapejob',
+            name='sounds_total',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='scrapejob',
+            name='status',
+            field=models.CharField(choices=[('queued', 'queued'), ('scraping', 'scraping'), ('processing', 'processing'), ('archiving', 'archiving'), ('finished', 'finished'), ('failed', 'failed')], db_index=True, default='queued', max_length=10),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.8 on 2026-10-18 09:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tiktokaggregator', '0009_scrapejob_sounds_total'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='videopost',
+            name='tiktok_video_id',
+            field=models.CharField(db_index=True, max_length=32, null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 3.2.8 on 2026-10-18 09:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tiktokaggregator', '0010_videopost_tiktok_video_id'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='last_post_created_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='last_post_id',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+    ]
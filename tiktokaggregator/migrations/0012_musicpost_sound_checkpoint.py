@@ -0,0 +1,34 @@
+# Generated by Django 3.2.8 on 2026-10-18 09:59
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tiktokaggregator', '0011_profile_crawl_watermark'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='musicpost',
+            name='scrape_job',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='tiktokaggregator.scrapejob'),
+        ),
+        migrations.AddField(
+            model_name='musicpost',
+            name='sound_dataset_offset',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='musicpost',
+            name='sound_heartbeat_at',
+            field=models.DateTimeField(blank=True, db_index=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='musicpost',
+            name='sound_run_id',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+    ]
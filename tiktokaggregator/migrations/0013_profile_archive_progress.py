@@ -0,0 +1,43 @@
+# Generated by Django 3.2.8 on 2026-10-18 10:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tiktokaggregator', '0012_musicpost_sound_checkpoint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='archive_bytes',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='archive_error',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='archive_started_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='archive_status',
+            field=models.CharField(choices=[('idle', 'idle'), ('queued', 'queued'), ('archiving', 'archiving'), ('finished', 'finished'), ('failed', 'failed')], db_index=True, default='idle', max_length=10),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='archive_videos_done',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='archive_videos_total',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 3.2.8 on 2026-10-18 10:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tiktokaggregator', '0013_profile_archive_progress'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='videopost',
+            name='video_object',
+            field=models.FileField(blank=True, max_length=300, upload_to='videos/objects/'),
+        ),
+    ]
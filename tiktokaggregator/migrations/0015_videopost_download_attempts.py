@@ -0,0 +1,23 @@
+# Generated by Django 3.2.8 on 2026-10-18 10:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tiktokaggregator', '0014_videopost_video_object'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='videopost',
+            name='download_attempts',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='videopost',
+            name='status',
+            field=models.CharField(choices=[('created', 'created'), ('uploadedToS3', 'uploadedToS3'), ('failed', 'failed')], db_index=True, default='created', max_length=15),
+        ),
+    ]
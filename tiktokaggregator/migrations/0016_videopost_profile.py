@@ -0,0 +1,19 @@
+# Generated by Django 3.2.8 on 2026-10-18 10:21
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tiktokaggregator', '0015_videopost_download_attempts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='videopost',
+            name='profile',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.PROTECT, to='tiktokaggregator.profile'),
+        ),
+    ]
@@ -0,0 +1,40 @@
+from django.db import migrations
+from django.db.models import OuterRef, Subquery
+
+BATCH_SIZE = 5000
+
+
+def backfill_profile(apps, schema_editor):
+    """
+    Copy retrieved_from_post.profile_url to VideoPost.profile one short
+    transaction per batch, so the table is never locked for the whole
+    backfill. Batches follow the primary key index; primary keys are random
+    UUIDs, so rows inserted behind the cursor meanwhile are filled by one
+    last sweep.
+    """
+    VideoPost = apps.get_model('tiktokaggregator', 'VideoPost')
+    MusicPost = apps.get_model('tiktokaggregator', 'MusicPost')
+    profile_url = MusicPost.objects.filter(pk=OuterRef('retrieved_from_post_id')).values('profile_url')[:1]
+    last_pk = None
+    while True:
+        batch = VideoPost.objects.order_by('pk')
+        if last_pk is not None:
+            batch = batch.filter(pk__gt=last_pk)
+        pks = list(batch.values_list('pk', flat=True)[:BATCH_SIZE])
+        if not pks:
+            break
+        VideoPost.objects.filter(pk__in=pks, profile__isnull=True).update(profile=Subquery(profile_url))
+        last_pk = pks[-1]
+    VideoPost.objects.filter(profile__isnull=True).update(profile=Subquery(profile_url))
+
+class Migration(migrations.Migration):
+    # Every batch commits on its own
+    atomic = False
+
+    dependencies = [
+        ('tiktokaggregator', '0016_videopost_profile'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_profile, migrations.RunPython.noop, elidable=True),
+    ]
@@ -0,0 +1,33 @@
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class AddIndexConcurrentlyOnPostgres(AddIndexConcurrently):
+    """``AddIndexConcurrently`` on PostgreSQL, so writes aren't blocked while the index builds, ``AddIndex`` elsewhere."""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+        else:
+            migrations.AddIndex.database_forwards(self, app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+        else:
+            migrations.AddIndex.database_backwards(self, app_label, schema_editor, from_state, to_state)
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('tiktokaggregator', '0017_backfill_videopost_profile'),
+    ]
+
+    operations = [
+        AddIndexConcurrentlyOnPostgres(
+            model_name='videopost',
+            index=models.Index(fields=['profile', 'status', 'created_at'], name='videopost_profile_status_idx'),
+        ),
+    ]
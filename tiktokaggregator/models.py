@@ -1,17 +1,78 @@
+import datetime
 import logging
 import uuid
 
-from django.db import models
+from django.conf import settings
+from django.db import connections, models
+from django.db.models import F, Q
 from django.utils import timezone
 
+from tiktokparser.utils.metrics import track
+
 logger = logging.getLogger(__name__)
 
 
+class PostQuerySet(models.QuerySet):
+    def bulk_create_new(self, objs, batch_size=1000):
+        """
+        Insert ``objs``, skipping rows that conflict with existing ones, and
+        return only the objects that were actually inserted.
+        """
+        objs = list(objs)
+        if not objs:
+            return []
+        with track(f"db_bulk_create_{self.model._meta.model_name}") as tracker:
+            if connections[self.db].vendor == "postgresql":
+                inserted_pks = self._insert_returning_new(objs, batch_size)
+            else:
+                # Primary keys are generated client-side, so the rows found under
+                # our own pks are exactly the ones this call inserted.
+                self.bulk_create(objs, batch_size=batch_size, ignore_conflicts=True)
+                inserted_pks = set(
+                    self.filter(pk__in=[obj.pk for obj in objs]).values_list(
+                        "pk", flat=True
+                    )
+                )
+            tracker.add(items=len(inserted_pks))
+        inserted = [obj for obj in objs if obj.pk in inserted_pks]
+        for obj in inserted:
+            obj._state.adding = False
+            obj._state.db = self.db
+        return inserted
+
+    def _insert_returning_new(self, objs, batch_size):
+        connection = connections[self.db]
+        opts = self.model._meta
+        fields = opts.concrete_fields
+        quote_name = connection.ops.quote_name
+        columns = ", ".join(quote_name(field.column) for field in fields)
+        row = f"({', '.join(['%s'] * len(fields))})"
+        inserted_pks = set()
+        for i in range(0, len(objs), batch_size):
+            batch = objs[i : i + batch_size]
+            params = [
+                field.get_db_prep_save(field.pre_save(obj, True), connection)
+                for obj in batch
+                for field in fields
+            ]
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    f"INSERT INTO {quote_name(opts.db_table)} ({columns}) "
+                    f"VALUES {', '.join([row] * len(batch))} "
+                    f"ON CONFLICT DO NOTHING RETURNING {quote_name(opts.pk.column)}",
+                    params,
+                )
+                inserted_pks.update(opts.pk.to_python(pk) for pk, in cursor.fetchall())
+        return inserted_pks
+
+
 class BasePostModel(models.Model):
     id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = PostQuerySet.as_manager()
+
     class Meta:
         abstract = True
 
@@ -22,8 +83,37 @@ class BasePostModel(models.Model):
 
 
 class Profile(BasePostModel):
+    ARCHIVE_IDLE = "idle"
+    ARCHIVE_QUEUED = "queued"
+    ARCHIVE_ARCHIVING = "archiving"
+    ARCHIVE_FINISHED = "finished"
+    ARCHIVE_FAILED = "failed"
+    ARCHIVE_STATUS_CHOICES = [
+        (ARCHIVE_IDLE, ARCHIVE_IDLE),
+        (ARCHIVE_QUEUED, ARCHIVE_QUEUED),
+        (ARCHIVE_ARCHIVING, ARCHIVE_ARCHIVING),
+        (ARCHIVE_FINISHED, ARCHIVE_FINISHED),
+        (ARCHIVE_FAILED, ARCHIVE_FAILED),
+    ]
+    ARCHIVE_ACTIVE_STATUSES = [ARCHIVE_QUEUED, ARCHIVE_ARCHIVING]
+
     url = models.CharField(max_length=255, db_index=True, null=True)
     video_archive = models.FileField(upload_to="videos/", null=True, blank=True)
+    # Crawl watermark: the newest post seen by a finished scrape of this profile
+    last_post_created_at = models.DateTimeField(null=True, blank=True)
+    last_post_id = models.CharField(max_length=64, null=True, blank=True)
+    # Progress of the latest archive run
+    archive_status = models.CharField(
+        max_length=10,
+        choices=ARCHIVE_STATUS_CHOICES,
+        db_index=True,
+        default=ARCHIVE_IDLE,
+    )
+    archive_error = models.TextField(blank=True, default="")
+    archive_started_at = models.DateTimeField(null=True, blank=True)
+    archive_videos_total = models.PositiveIntegerField(default=0)
+    archive_videos_done = models.PositiveIntegerField(default=0)
+    archive_bytes = models.PositiveBigIntegerField(default=0)
 
     def __str__(self):
         return self.url
@@ -32,6 +122,84 @@ class Profile(BasePostModel):
     def profile_name(self):
         return self.url.split("/")[-1]
 
+    def advance_crawl_watermark(self, created_at, post_id):
+        """Move the watermark forward, never back past a newer concurrent crawl."""
+        if created_at is None:
+            return
+        older = Q(last_post_created_at__isnull=True)
+        older |= Q(last_post_created_at__lt=created_at)
+        updated = Profile.objects.filter(older, pk=self.pk).update(
+            last_post_created_at=created_at,
+            last_post_id=post_id,
+            updated_at=timezone.now(),
+        )
+        if updated:
+            self.last_post_created_at = created_at
+            self.last_post_id = post_id
+
+    @property
+    def archive_eta(self):
+        """Time left for the running archive at its average rate so far."""
+        if self.archive_status != self.ARCHIVE_ARCHIVING:
+            return None
+        if not self.archive_videos_done:
+            return None
+        remaining = max(self.archive_videos_total - self.archive_videos_done, 0)
+        elapsed = timezone.now() - self.archive_started_at
+        return elapsed * remaining / self.archive_videos_done
+
+    @classmethod
+    def _archive_claimable(cls):
+        """Profiles without an archive in progress, or whose archive stopped making progress."""
+        cutoff = timezone.now() - datetime.timedelta(
+            seconds=settings.ARCHIVE_STALE_AFTER
+        )
+        claimable = ~Q(archive_status__in=cls.ARCHIVE_ACTIVE_STATUSES)
+        claimable |= Q(updated_at__lt=cutoff)
+        return claimable
+
+    @classmethod
+    def queue_archive(cls, profile_id):
+        """Mark the profile as queued for archiving unless an archive is already underway."""
+        return bool(
+            cls.objects.filter(cls._archive_claimable(), pk=profile_id).update(
+                archive_status=cls.ARCHIVE_QUEUED,
+                archive_error="",
+                updated_at=timezone.now(),
+            )
+        )
+
+    @classmethod
+    def start_archive(cls, profile_id):
+        """Move a queued (or claimable) profile to archiving; only one concurrent caller succeeds."""
+        claimable = cls._archive_claimable() | Q(archive_status=cls.ARCHIVE_QUEUED)
+        now = timezone.now()
+        return bool(
+            cls.objects.filter(claimable, pk=profile_id).update(
+                archive_status=cls.ARCHIVE_ARCHIVING,
+                archive_error="",
+                archive_started_at=now,
+                archive_videos_total=0,
+                archive_videos_done=0,
+                archive_bytes=0,
+                updated_at=now,
+            )
+        )
+
+    @classmethod
+    def set_archive_status(cls, profile_id, status, **fields):
+        cls.objects.filter(pk=profile_id).update(
+            archive_status=status, updated_at=timezone.now(), **fields
+        )
+
+    @classmethod
+    def advance_archive(cls, profile_id, **counters):
+        """Atomically add ``counters`` to the archive progress fields of a profile."""
+        cls.objects.filter(pk=profile_id).update(
+            updated_at=timezone.now(),
+            **{name: F(name) + value for name, value in counters.items()},
+        )
+
 
 class MusicPost(BasePostModel):
     STATUS_CREATED = "created"
@@ -51,24 +219,108 @@ class MusicPost(BasePostModel):
     )
     music_url = models.URLField(max_length=500, unique=True, db_index=True)
     profile_url = models.ForeignKey(Profile, on_delete=models.PROTECT, null=True)
+    scrape_job = models.ForeignKey(
+        "ScrapeJob", on_delete=models.SET_NULL, null=True, blank=True
+    )
+    # Sound processing checkpoint: the sound scraper run and how much of its
+    # dataset has been fully processed (videos resolved and saved)
+    sound_run_id = models.CharField(max_length=64, null=True, blank=True)
+    sound_dataset_offset = models.PositiveIntegerField(default=0)
+    sound_heartbeat_at = models.DateTimeField(null=True, blank=True, db_index=True)
 
     def __str__(self):
         return f"Post {self.id} by {self.author}"
 
+    def save_checkpoint(self, **fields):
+        """Persist checkpoint ``fields`` and refresh the heartbeat."""
+        fields.update(sound_heartbeat_at=timezone.now(), updated_at=timezone.now())
+        for name, value in fields.items():
+            setattr(self, name, value)
+        MusicPost.objects.filter(pk=self.pk).update(**fields)
+
 
 class VideoPost(BasePostModel):
     STATUS_CREATED = "created"
     STATUS_UPLOADED = "uploadedToS3"
+    STATUS_FAILED = "failed"
     STATUS_CHOICES = [
         (STATUS_CREATED, STATUS_CREATED),
         (STATUS_UPLOADED, STATUS_UPLOADED),
+        (STATUS_FAILED, STATUS_FAILED),
     ]
     status = models.CharField(
         max_length=15, choices=STATUS_CHOICES, db_index=True, default=STATUS_CREATED
     )
     retrieved_from_post = models.ForeignKey(MusicPost, on_delete=models.PROTECT)
+    # Copy of retrieved_from_post.profile_url, so profile queries need no join;
+    # indexed by the composite index below
+    profile = models.ForeignKey(
+        Profile, on_delete=models.PROTECT, null=True, blank=True, db_index=False
+    )
     download_video_id = models.CharField(max_length=256, db_index=True, unique=True)
     download_video_url = models.CharField(max_length=500, null=True)
+    tiktok_video_id = models.CharField(max_length=32, null=True, db_index=True)
+    # Archive runs that failed to download this video
+    download_attempts = models.PositiveIntegerField(default=0)
+    # The video in the per-video store, uploaded once and reused by every archive
+    video_object = models.FileField(
+        upload_to="videos/objects/", max_length=300, blank=True
+    )
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=["profile", "status", "created_at"],
+                name="videopost_profile_status_idx",
+            ),
+        ]
 
     def __str__(self):
         return f"VideoPost related to Post {self.retrieved_from_post.id} by {self.retrieved_from_post.author}"
+
+
+class ScrapeJob(BasePostModel):
+    STATUS_QUEUED = "queued"
+    STATUS_SCRAPING = "scraping"
+    STATUS_PROCESSING = "processing"
+    STATUS_ARCHIVING = "archiving"
+    STATUS_FINISHED = "finished"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, STATUS_QUEUED),
+        (STATUS_SCRAPING, STATUS_SCRAPING),
+        (STATUS_PROCESSING, STATUS_PROCESSING),
+        (STATUS_ARCHIVING, STATUS_ARCHIVING),
+        (STATUS_FINISHED, STATUS_FINISHED),
+        (STATUS_FAILED, STATUS_FAILED),
+    ]
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, db_index=True, default=STATUS_QUEUED
+    )
+    profile = models.ForeignKey(Profile, on_delete=models.PROTECT, null=True)
+    run_input = models.JSONField(default=dict)
+    error = models.TextField(blank=True, default="")
+    posts_scraped = models.PositiveIntegerField(default=0)
+    sounds_total = models.PositiveIntegerField(default=0)
+    sounds_processed = models.PositiveIntegerField(default=0)
+    videos_found = models.PositiveIntegerField(default=0)
+    videos_archived = models.PositiveIntegerField(default=0)
+
+    def __str__(self):
+        return f"ScrapeJob {self.id} ({self.status})"
+
+    @classmethod
+    def set_status(cls, job_id, status, **fields):
+        if job_id:
+            cls.objects.filter(pk=job_id).update(
+                status=status, updated_at=timezone.now(), **fields
+            )
+
+    @classmethod
+    def advance(cls, job_id, **counters):
+        """Atomically add ``counters`` to the progress fields of a job."""
+        if job_id and counters:
+            cls.objects.filter(pk=job_id).update(
+                updated_at=timezone.now(),
+                **{name: F(name) + value for name, value in counters.items()},
+            )
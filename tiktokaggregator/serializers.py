@@ -1,6 +1,8 @@
 # serializers.py
 from rest_framework import serializers
 
+from .models import ScrapeJob
+
 
 class TikTokScrapperInputSerializer(serializers.Serializer):
     disableCheerioBoost = serializers.BooleanField(default=False)
@@ -19,3 +21,24 @@ class TikTokScrapperInputSerializer(serializers.Serializer):
         max_length=200, required=False, allow_blank=True
     )
     maxProfilesPerQuery = serializers.IntegerField(default=10)
+
+
+class ScrapeJobSerializer(serializers.ModelSerializer):
+    profile = serializers.StringRelatedField()
+
+    class Meta:
+        model = ScrapeJob
+        fields = (
+            "id",
+            "status",
+            "profile",
+            "error",
+            "posts_scraped",
+            "sounds_total",
+            "sounds_processed",
+            "videos_found",
+            "videos_archived",
+            "created_at",
+            "updated_at",
+        )
+        read_only_fields = fields
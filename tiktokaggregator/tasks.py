@@ -1,40 +1,109 @@
+import asyncio
 import datetime
+import gc
 import logging
-import threading
-from io import BytesIO
+from urllib.parse import urlsplit
 from zipfile import ZipFile
-import gc
 
 import requests
-from celery import shared_task
-from django.core.files.base import ContentFile
+from botocore.exceptions import BotoCoreError, ClientError
+from celery import chord, group, shared_task
+from django.conf import settings
+from django.db.models import F, Q
 from django.db.utils import IntegrityError
+from django.utils import timezone
 
-from clients.apify import (TikTokScrapperClient, TikTokSoundScraperClient,
-                           TikTokVideoDownloadClient)
-from tiktokparser.utils.helpers import ThreadWithReturnValue
+from clients.apify import (ApifyRunError, TikTokScrapperClient,
+                           TikTokSoundScraperClient, TikTokVideoDownloadClient,
+                           extract_tiktok_video_id,
+                           get_download_item_tiktok_video_id)
+from tiktokparser.utils.archives import write_central_directory, zip_entry, zip_info
+from tiktokparser.utils.batching import BatchCoalescer
+from tiktokparser.utils.downloads import DownloadEngine
+from tiktokparser.utils.locks import ClusterSemaphore
+from tiktokparser.utils.metrics import count_profile, track
+from tiktokparser.utils.pipeline import Stage, StagePipeline
 
-from .models import MusicPost, Profile, VideoPost
+from .models import MusicPost, Profile, ScrapeJob, VideoPost
 
 logger = logging.getLogger(__name__)
 
 
-def get_existing_music_urls():
-    return set(MusicPost.objects.values_list("music_url", flat=True))
+def get_existing_music_urls(music_urls):
+    """Return which of ``music_urls`` are already stored, with one indexed lookup."""
+    return set(
+        MusicPost.objects.filter(music_url__in=set(music_urls)).values_list(
+            "music_url", flat=True
+        )
+    )
 
 
-def get_existing_tiktok_video_ids():
-    return set(VideoPost.objects.values_list("download_video_id", flat=True))
+def get_existing_tiktok_video_ids(video_ids):
+    """Return which of ``video_ids`` are already stored, with one indexed lookup."""
+    return set(
+        VideoPost.objects.filter(download_video_id__in=set(video_ids)).values_list(
+            "download_video_id", flat=True
+        )
+    )
 
 
 def filter_general_posts(items, existing_urls):
-    return [item for item in items if item["music_url"] not in existing_urls]
+    # Also drops repeats of the same sound within ``items``
+    seen = set(existing_urls)
+    filtered = []
+    for item in items:
+        if item["music_url"] not in seen:
+            seen.add(item["music_url"])
+            filtered.append(item)
+    return filtered
+
+
+def get_known_tiktok_video_ids(tiktok_video_ids):
+    """
+    Return which of ``tiktok_video_ids`` already have a VideoPost. Older rows
+    only have the id embedded in ``download_video_id``, so both are checked.
+    """
+    tiktok_video_ids = set(tiktok_video_ids)
+    tiktok_video_ids.discard(None)
+    if not tiktok_video_ids:
+        return set()
+    lookup = Q(tiktok_video_id__in=tiktok_video_ids)
+    lookup |= Q(download_video_id__in=tiktok_video_ids)
+    known = VideoPost.objects.filter(lookup).values_list(
+        "tiktok_video_id", "download_video_id"
+    )
+    known_ids = {
+        video_id for row in known for video_id in row if video_id in tiktok_video_ids
+    }
+    known_ids.discard(None)
+    return known_ids
+
+
+def drop_known_videos(processed_items):
+    """
+    Drop the items whose video already has a VideoPost. Items without a TikTok
+    video id are kept, they are only deduplicated once downloaded.
+    """
+    known_ids = get_known_tiktok_video_ids(
+        item["tiktok_video_id"] for item in processed_items
+    )
+    return [
+        item
+        for item in processed_items
+        if item["tiktok_video_id"] is None or item["tiktok_video_id"] not in known_ids
+    ]
 
 
 def filter_video_posts(items, existing_ids):
     return [item for item in items if item not in existing_ids]
 
 
+def normalize_video_url(url):
+    """The host and path of a video URL, to match downloads to their start URL."""
+    parts = urlsplit(str(url or "").strip())
+    return f"{parts.netloc.lower()}{parts.path.rstrip('/')}"
+
+
 def process_sound_tiktok_results(raw_items):
     processed_items = []
     for item in raw_items:
@@ -42,28 +111,55 @@ def process_sound_tiktok_results(raw_items):
         text = item["text"]
         author_name = item["authorMeta"]["name"]
         tiktok_video_url = item["webVideoUrl"]
+        tiktok_video_id = extract_tiktok_video_id(item.get("id")) or (
+            extract_tiktok_video_id(tiktok_video_url)
+        )
 
         processed_items.append(
             {
                 "text": text,
                 "author": author_name,
                 "tiktok_video_url": tiktok_video_url,
+                "tiktok_video_id": tiktok_video_id,
             }
         )
     return processed_items
 
 
-def process_sound_data(music_post_id, chunk_size=500):
-    try:
-        music_post = MusicPost.objects.get(id=music_post_id)
-    except MusicPost.DoesNotExist:
-        return  # MusicPost not found
-
-    music_post.status = MusicPost.STATUS_PENDING
-    music_post.save()
-
-    client = TikTokSoundScraperClient()
-    run_input = {
+def resolve_video_downloads(tiktok_video_urls):
+    """Run one TikTokVideoDownloadClient actor call for ``tiktok_video_urls``."""
+    video_download_client = TikTokVideoDownloadClient()
+    download_videos = video_download_client.run(
+        {
+            "startUrls": [{"url": url} for url in tiktok_video_urls],
+            "proxy": {"useApifyProxy": True},
+        }
+    )
+    for item in download_videos:
+        download_video_id = item["video"].split(".mp4")[0]
+        yield {
+            # The actor echoes the start URL the video was resolved from
+            "start_url": normalize_video_url(
+                item.get("url") or item.get("webVideoUrl")
+            ),
+            "download_video_id": download_video_id,
+            "download_video_url": video_download_client.get_download_video_url(
+                download_video_id
+            ),
+            "tiktok_video_id": get_download_item_tiktok_video_id(item),
+        }
+
+
+video_download_coalescer = BatchCoalescer(
+    resolve_video_downloads,
+    result_key=lambda download: download["start_url"],
+    batch_size=settings.VIDEO_DOWNLOAD_BATCH_SIZE,
+    max_wait=settings.VIDEO_DOWNLOAD_BATCH_MAX_WAIT,
+)
+
+
+def sound_scraper_run_input(music_post):
+    return {
         "disableCheerioBoost": False,
         "disableEnrichAuthorStats": False,
         "musics": [music_post.music_url],
@@ -73,54 +169,376 @@ def process_sound_data(music_post_id, chunk_size=500):
         "shouldDownloadVideos": False,
     }
 
-    sound_data_generator = client.run(run_input)
-    existing_tiktok_ids = get_existing_tiktok_video_ids()
+
+def start_sound_run(client, music_post):
+    """Reattach to the checkpointed sound scraper run or start a new one."""
+    if music_post.sound_run_id:
+        try:
+            reader = client.resume_run(
+                music_post.sound_run_id,
+                offset=music_post.sound_dataset_offset,
+                # Keeps resume_stale_sounds off a sound waiting on a long run
+                on_wait=lambda run: music_post.save_checkpoint(),
+            )
+            logger.info(
+                f"Resuming {music_post} at offset {music_post.sound_dataset_offset}"
+            )
+            return reader
+        except ApifyRunError:
+            logger.warning(f"Checkpointed run of {music_post} failed, starting over")
+    music_post.save_checkpoint(sound_run_id=None, sound_dataset_offset=0)
+    return client.run_actor(
+        client.ACTOR_ID,
+        sound_scraper_run_input(music_post),
+        on_run=lambda run: music_post.save_checkpoint(sound_run_id=run["id"]),
+        on_wait=lambda run: music_post.save_checkpoint(),
+    )
+
+
+def save_sound_videos(music_post, processed_chunk, job_id=None):
+    # Drop videos we already have before paying for a download actor run
+    processed_chunk = drop_known_videos(processed_chunk)
+    if not processed_chunk:
+        return
+
+    # Resolved together with the pending videos of other sound jobs, results
+    # are routed back by start URL so videos without a TikTok id get theirs too
+    downloads = video_download_coalescer.submit(
+        (normalize_video_url(item["tiktok_video_url"]), item["tiktok_video_url"])
+        for item in processed_chunk
+    ).result()
+    downloads_by_id = {
+        download["download_video_id"]: download for download in downloads
+    }
+    filtered_video_ids = filter_video_posts(
+        downloads_by_id, get_existing_tiktok_video_ids(downloads_by_id)
+    )
+    video_posts = [
+        VideoPost(
+            retrieved_from_post=music_post,
+            profile_id=music_post.profile_url_id,
+            download_video_id=download["download_video_id"],
+            download_video_url=download["download_video_url"],
+            tiktok_video_id=download["tiktok_video_id"],
+        )
+        for download in map(downloads_by_id.get, filtered_video_ids)
+    ]
+
+    created_video_posts = VideoPost.objects.bulk_create_new(video_posts)
+    ScrapeJob.advance(job_id, videos_found=len(created_video_posts))
+    count_profile(music_post.profile_url, "videos", len(created_video_posts))
+    logger.info(f"{len(created_video_posts)} new videos saved for {music_post}")
+
+
+def process_sound_data(music_post_id, chunk_size=500, job_id=None):
+    """
+    Resolve and save the videos of a sound, checkpointing the dataset offset
+    after every chunk so that a restarted job continues where the last one
+    stopped. Returns whether this call is the one that completed the sound.
+    """
+    try:
+        music_post = MusicPost.objects.select_related("profile_url").get(
+            id=music_post_id
+        )
+    except MusicPost.DoesNotExist:
+        return True  # MusicPost not found, nothing left to process
+    if music_post.status in (MusicPost.STATUS_FINISHED, MusicPost.STATUS_FAILED):
+        return False  # Redelivered after it was already completed
+
+    music_post.save_checkpoint(status=MusicPost.STATUS_PENDING)
+
+    client = TikTokSoundScraperClient()
+    sound_data_generator = start_sound_run(client, music_post)
+    offset = music_post.sound_dataset_offset
 
     for raw_sound_data_chunk in chunked_generator(sound_data_generator, chunk_size):
-        processed_chunk = process_sound_tiktok_results(raw_sound_data_chunk)
+        save_sound_videos(
+            music_post, process_sound_tiktok_results(raw_sound_data_chunk), job_id
+        )
+        # Only advanced once the chunk's download batch is saved
+        offset += len(raw_sound_data_chunk)
+        music_post.save_checkpoint(sound_dataset_offset=offset)
+    return complete_sound(music_post_id, MusicPost.STATUS_FINISHED)
+
+
+def complete_sound(music_post_id, status):
+    """Move a pending sound to ``status``; only one concurrent caller succeeds."""
+    return bool(
+        MusicPost.objects.filter(
+            id=music_post_id, status=MusicPost.STATUS_PENDING
+        ).update(status=status, updated_at=timezone.now())
+    )
 
-        video_download_client = TikTokVideoDownloadClient()
-        download_videos = video_download_client.run(
-            {
-                "startUrls": [
-                    {"url": item["tiktok_video_url"]} for item in processed_chunk
-                ],
-                "proxy": {"useApifyProxy": True},
-            }
+
+def sound_processing_slots():
+    return ClusterSemaphore(
+        "sound-processing",
+        settings.SOUND_PROCESSING_CONCURRENCY,
+        settings.SOUND_PROCESSING_SLOT_TIMEOUT,
+    )
+
+
+@shared_task(bind=True, acks_late=True)
+def process_sound_data_task(self, music_post_id, job_id=None, attempt=0):
+    slots = sound_processing_slots()
+    token = slots.acquire()
+    if token is None:
+        # Every slot is busy somewhere in the cluster, come back later
+        raise self.retry(
+            countdown=settings.SOUND_PROCESSING_SLOT_RETRY_DELAY, max_retries=None
         )
-        download_video_ids = [
-            item["video"].split(".mp4")[0] for item in download_videos
-        ]
-        filtered_video_ids = filter_video_posts(download_video_ids, existing_tiktok_ids)
-        video_posts = [
-            VideoPost(
-                retrieved_from_post=music_post,
-                download_video_id=filtered_video_id,
-                download_video_url=video_download_client.get_download_video_url(
-                    filtered_video_id
-                ),
+    try:
+        completed = process_sound_data(music_post_id, job_id=job_id)
+    except Exception as e:
+        if attempt < settings.SOUND_PROCESSING_MAX_RETRIES:
+            raise self.retry(
+                exc=e,
+                countdown=10 * 2**attempt,
+                max_retries=None,
+                args=(music_post_id, job_id),
+                kwargs={"attempt": attempt + 1},
             )
-            for filtered_video_id in filtered_video_ids
-        ]
+        logger.exception(f"Failed to process sound for MusicPost {music_post_id}")
+        completed = complete_sound(music_post_id, MusicPost.STATUS_FAILED)
+    finally:
+        slots.release(token)
+    if completed:
+        ScrapeJob.advance(job_id, sounds_processed=1)
+        start_archive_when_sounds_done(job_id)
 
-        VideoPost.objects.bulk_create(video_posts, ignore_conflicts=True)
-        logger.info(f"{filtered_video_ids} is saved")
-    music_post.status = MusicPost.STATUS_FINISHED
-    music_post.save()
+
+@shared_task
+def resume_stale_sounds():
+    """
+    Re-queue pending sounds whose worker stopped sending heartbeats; they
+    continue from their checkpoint.
+    """
+    now = timezone.now()
+    cutoff = now - datetime.timedelta(seconds=settings.SOUND_PROCESSING_STALE_AFTER)
+    # Sounds left pending before heartbeats existed have none
+    stale = Q(sound_heartbeat_at__isnull=True, updated_at__lt=cutoff)
+    stale |= Q(sound_heartbeat_at__lt=cutoff)
+    stale &= Q(status=MusicPost.STATUS_PENDING)
+    for music_post_id, job_id in MusicPost.objects.filter(stale).values_list(
+        "id", "scrape_job_id"
+    ):
+        # Claim the sound so an overlapping sweep does not queue it twice
+        claimed = MusicPost.objects.filter(stale, id=music_post_id).update(
+            sound_heartbeat_at=now
+        )
+        if claimed:
+            logger.info(f"Resuming stale sound processing of MusicPost {music_post_id}")
+            process_sound_data_task.delay(
+                str(music_post_id), str(job_id) if job_id else None
+            )
+
+
+@shared_task
+def process_sounds_async_task(music_post_ids, job_id=None):
+    """Process a batch of sounds concurrently from one asyncio event loop."""
+    from .async_pipeline import process_sounds_async
+
+    asyncio.run(process_sounds_async(music_post_ids, job_id=job_id))
+
+
+def dispatch_sound_processing(music_post_ids, job_id=None):
+    """Fan out sound processing of ``music_post_ids`` to the Celery workers."""
+    if not music_post_ids:
+        return
+    # Count the sounds before queueing them so sounds_processed never overtakes sounds_total
+    ScrapeJob.advance(job_id, sounds_total=len(music_post_ids))
+    music_post_ids = [str(music_post_id) for music_post_id in music_post_ids]
+    if settings.APIFY_ASYNC_MODE:
+        batch_size = settings.SOUND_PROCESSING_ASYNC_BATCH_SIZE
+        group(
+            process_sounds_async_task.s(music_post_ids[i : i + batch_size], job_id)
+            for i in range(0, len(music_post_ids), batch_size)
+        ).apply_async()
+        return
+    group(
+        process_sound_data_task.s(music_post_id, job_id)
+        for music_post_id in music_post_ids
+    ).apply_async()
+
+
+def start_archive_when_sounds_done(job_id):
+    """Queue the archive step once scraping is over and every sound is processed."""
+    if not job_id:
+        return
+    started = ScrapeJob.objects.filter(
+        pk=job_id,
+        status=ScrapeJob.STATUS_PROCESSING,
+        sounds_processed__gte=F("sounds_total"),
+    ).update(status=ScrapeJob.STATUS_ARCHIVING, updated_at=timezone.now())
+    if started:
+        profile_id = ScrapeJob.objects.values_list("profile_id", flat=True).get(
+            pk=job_id
+        )
+        # Queued regardless: if the profile is being archived already, the task
+        # waits for that archive and then archives the videos it left
+        Profile.queue_archive(profile_id)
+        archive_profile_videos.delay(str(profile_id), job_id)
+
+
+class CrawlWatermark:
+    """
+    Stops reading a profile's posts once the crawl reaches the ones seen by the
+    previous crawl, and remembers the newest post for the next one.
+
+    Posts come newest first, except for pinned ones at the top. Those are
+    skipped when the scraper flags them, and the crawl stops only after more
+    than ``PROFILE_CRAWL_PINNED_POSTS`` consecutive already-seen posts.
+    """
+
+    def __init__(self, profile):
+        self.profile = profile
+        self.since = (
+            profile.last_post_created_at if settings.PROFILE_CRAWL_INCREMENTAL else None
+        )
+        self.newest_created_at = None
+        self.newest_id = None
+
+    def run_input(self, run_input):
+        """Ask the scraper only for posts published since the watermark day."""
+        if self.since is None:
+            return run_input
+        return {**run_input, "oldestPostDate": self.since.strftime("%Y-%m-%d")}
+
+    def new_posts(self, raw_items):
+        seen_in_a_row = 0
+        for item in raw_items:
+            created_at = post_created_at(item)
+            if created_at and (
+                self.newest_created_at is None or created_at > self.newest_created_at
+            ):
+                self.newest_created_at = created_at
+                self.newest_id = item.get("id")
+
+            if self.since and created_at and created_at <= self.since:
+                if item.get("isPinned"):
+                    continue
+                seen_in_a_row += 1
+                if seen_in_a_row > settings.PROFILE_CRAWL_PINNED_POSTS:
+                    logger.info(
+                        f"Reached posts seen by the last crawl of {self.profile}"
+                    )
+                    return
+                continue
+            seen_in_a_row = 0
+            yield item
+
+    def save(self):
+        self.profile.advance_crawl_watermark(self.newest_created_at, self.newest_id)
+
+
+def post_created_at(item):
+    create_time = item.get("createTime")
+    if not create_time:
+        return None
+    return datetime.datetime.fromtimestamp(int(create_time), tz=datetime.timezone.utc)
 
 
 @shared_task
-def process_tiktok_data(run_input):
-    client = TikTokScrapperClient()
-    raw_items_generator = client.run(run_input)
-    logger.info(run_input)
-    profile, _ = Profile.objects.get_or_create(url=run_input["profiles"][0])
-
-    # Process items from the generator
-    for raw_items_chunk in chunked_generator(raw_items_generator, chunk_size=500):
-        processed_items = process_tiktok_results(raw_items_chunk)
-        save_posts_in_chunks(processed_items, profile)
+def process_tiktok_data(run_input, job_id=None):
+    ScrapeJob.set_status(job_id, ScrapeJob.STATUS_SCRAPING)
+    try:
+        profile, _ = Profile.objects.get_or_create(url=run_input["profiles"][0])
+        watermark = CrawlWatermark(profile)
+        client = TikTokScrapperClient()
+        raw_items_generator = client.run(watermark.run_input(run_input))
+        logger.info(run_input)
+
+        scrape_pipeline(profile, job_id=job_id).run(
+            chunked_generator(
+                watermark.new_posts(raw_items_generator),
+                chunk_size=settings.SCRAPE_PIPELINE_CHUNK_SIZE,
+            )
+        )
+        watermark.save()
+    except Exception as e:
+        ScrapeJob.set_status(job_id, ScrapeJob.STATUS_FAILED, error=str(e))
+        raise
     logger.info("Saved all posts sussesfully")
+    ScrapeJob.set_status(job_id, ScrapeJob.STATUS_PROCESSING)
+    start_archive_when_sounds_done(job_id)
+
+
+def archive_slots():
+    return ClusterSemaphore(
+        "archives", settings.ARCHIVE_CONCURRENCY, settings.ARCHIVE_SLOT_TIMEOUT
+    )
+
+
+@shared_task(bind=True, acks_late=True)
+def archive_profile_videos(self, profile_id, job_id=None):
+    slots = archive_slots()
+    token = slots.acquire()
+    if token is None:
+        # Every slot is busy somewhere in the cluster; keep the queued profile
+        # fresh so it isn't taken for a lost archive while it waits
+        Profile.objects.filter(
+            pk=profile_id, archive_status=Profile.ARCHIVE_QUEUED
+        ).update(updated_at=timezone.now())
+        raise self.retry(countdown=settings.ARCHIVE_SLOT_RETRY_DELAY, max_retries=None)
+    sharded = False
+    try:
+        started = Profile.start_archive(profile_id)
+        if started:
+            sharded = run_archive(self.app, profile_id, job_id, token)
+    finally:
+        # A sharded archive keeps its slot until the shards are assembled
+        if not sharded:
+            slots.release(token)
+    if not started:
+        # Another task is archiving this profile, come back once it is done
+        raise self.retry(countdown=settings.ARCHIVE_SLOT_RETRY_DELAY, max_retries=None)
+
+
+def run_archive(app, profile_id, job_id=None, slot_token=None):
+    """Archive the profile here, or return ``True`` once it is handed to shard tasks."""
+    ScrapeJob.set_status(job_id, ScrapeJob.STATUS_ARCHIVING)
+    try:
+        profile = Profile.objects.get(id=profile_id)
+        video_posts = archive_video_posts(profile)
+        shards = archive_shard_count(app, video_posts.count())
+        if shards > 1 and video_posts.filter(pending_videos()).exists():
+            start_sharded_archive(profile, shards, job_id, slot_token)
+            return True
+        download_and_archive_videos(profile, job_id=job_id)
+    except Exception as e:
+        fail_archive(profile_id, job_id, e)
+        raise
+    finish_archive(profile_id, job_id)
+    return False
+
+
+def finish_archive(profile_id, job_id=None):
+    Profile.set_archive_status(profile_id, Profile.ARCHIVE_FINISHED)
+    ScrapeJob.set_status(job_id, ScrapeJob.STATUS_FINISHED)
+
+
+def fail_archive(profile_id, job_id, error):
+    Profile.set_archive_status(
+        profile_id, Profile.ARCHIVE_FAILED, archive_error=str(error)
+    )
+    ScrapeJob.set_status(job_id, ScrapeJob.STATUS_FAILED, error=str(error))
+
+
+@shared_task
+def retry_failed_videos():
+    """Queue an archive for every profile with failed videos that have attempts left."""
+    retryable = Q(
+        status=VideoPost.STATUS_FAILED,
+        download_attempts__lt=settings.VIDEO_DOWNLOAD_MAX_ATTEMPTS,
+    )
+    profile_ids = (
+        VideoPost.objects.filter(retryable).values_list("profile", flat=True).distinct()
+    )
+    for profile_id in profile_ids:
+        # Profiles being archived already are picked up by their next run
+        if profile_id and Profile.queue_archive(profile_id):
+            logger.info(f"Retrying failed video downloads of profile {profile_id}")
+            archive_profile_videos.delay(str(profile_id))
 
 
 def process_tiktok_results(raw_items):
@@ -141,40 +559,67 @@ def process_tiktok_results(raw_items):
     return processed_items
 
 
-def save_posts_in_chunks(processed_items, profile, chunk_size=500, max_retries=3):
-    existing_music_urls = get_existing_music_urls()
-
-    for i in range(0, len(processed_items), chunk_size):
-        logger.info("post")
-        logger.info(processed_items[0])
-        chunk = filter_general_posts(
-            processed_items[i : i + chunk_size], existing_music_urls
-        )
-        retry_count = 0
+def normalize_posts(raw_items, profile, job_id=None):
+    processed_items = process_tiktok_results(raw_items)
+    ScrapeJob.advance(job_id, posts_scraped=len(processed_items))
+    count_profile(profile, "posts", len(processed_items))
+    return processed_items
 
-        while chunk and retry_count < max_retries:
-            try:
-                created_posts = MusicPost.objects.bulk_create(
-                    [MusicPost(**item, profile_url=profile) for item in chunk],
-                    ignore_conflicts=True,
-                )
-                threads = []
 
-                for music_post in created_posts:
-                    threads.append(
-                        threading.Thread(
-                            target=process_sound_data, args=(music_post.id,)
-                        )
-                    )
-                for thread in threads:
-                    thread.start()
-                for thread in threads:
-                    thread.join()
-                break
-            except IntegrityError:
-                retry_count += 1
-                existing_music_urls = get_existing_music_urls()
-                chunk = filter_general_posts(chunk, existing_music_urls)
+def dedup_posts(processed_items):
+    existing_urls = get_existing_music_urls(
+        item["music_url"] for item in processed_items
+    )
+    return filter_general_posts(processed_items, existing_urls) or None
+
+
+def insert_posts(chunk, profile, max_retries=3, job_id=None):
+    """Insert new sounds and return the ids of the rows that were really created."""
+    retry_count = 0
+    while chunk and retry_count < max_retries:
+        try:
+            # Rows lost to a concurrent insert are not returned
+            created_posts = MusicPost.objects.bulk_create_new(
+                MusicPost(**item, profile_url=profile, scrape_job_id=job_id)
+                for item in chunk
+            )
+            count_profile(profile, "sounds", len(created_posts))
+            return [music_post.id for music_post in created_posts] or None
+        except IntegrityError:
+            retry_count += 1
+            chunk = dedup_posts(chunk)
+
+
+def scrape_pipeline(profile, job_id=None):
+    """
+    Scraped post chunks flow through normalize -> dedup -> insert -> dispatch
+    stages, so reading the dataset, database work and queueing sound tasks
+    overlap.
+    """
+    return StagePipeline(
+        "scrape",
+        [
+            Stage(
+                "normalize",
+                lambda raw_items: normalize_posts(raw_items, profile, job_id=job_id),
+                workers=settings.SCRAPE_PIPELINE_NORMALIZE_WORKERS,
+            ),
+            Stage("dedup", dedup_posts, workers=settings.SCRAPE_PIPELINE_DEDUP_WORKERS),
+            Stage(
+                "insert",
+                lambda chunk: insert_posts(chunk, profile, job_id=job_id),
+                workers=settings.SCRAPE_PIPELINE_INSERT_WORKERS,
+            ),
+            Stage(
+                "dispatch",
+                lambda music_post_ids: dispatch_sound_processing(
+                    music_post_ids, job_id=job_id
+                ),
+                workers=settings.SCRAPE_PIPELINE_DISPATCH_WORKERS,
+            ),
+        ],
+        queue_size=settings.SCRAPE_PIPELINE_QUEUE_SIZE,
+    )
 
 
 def chunked_generator(generator, chunk_size):
@@ -189,61 +634,301 @@ def chunked_generator(generator, chunk_size):
         yield chunk
 
 
-def download_video(profile: Profile, video_post: VideoPost):
+def video_object_name(video_post):
+    return video_post.video_object.field.generate_filename(
+        video_post, f"{video_post.download_video_id}.mp4"
+    )
+
+
+def record_video_object(video_post, name):
+    VideoPost.objects.filter(pk=video_post.pk).update(
+        video_object=name, updated_at=timezone.now()
+    )
+    video_post.video_object = name
+
+
+def store_video(video_post, video_file):
+    """Upload a downloaded video to the per-video store and record its key on the post."""
+    storage = video_post.video_object.storage
+    with track("video_store") as tracker:
+        # Streamed from the downloaded body, no extra copy of the video is made
+        name = storage.put_fileobj(video_object_name(video_post), video_file.reader())
+        tracker.add(items=1, nbytes=video_file.size)
+    record_video_object(video_post, name)
+
+
+def read_stored_video(engine, video_post):
+    """The video from the per-video store, or ``None`` when it isn't stored (anymore)."""
+    storage = video_post.video_object.storage
+    if not video_post.video_object:
+        name = video_object_name(video_post)
+        if not storage.exists(name):
+            return
+        # Uploaded by a run that stopped before recording it
+        record_video_object(video_post, name)
+    try:
+        return engine.fetch_object(storage.get_object(video_post.video_object.name))
+    except (BotoCoreError, ClientError, OSError) as e:
+        logger.warning(
+            f"Failed to read stored video {video_post.video_object.name}, downloading it again: {e}"
+        )
+
+
+def download_video(engine: DownloadEngine, profile: Profile, video_post: VideoPost):
+    video_file_name = f"{profile.profile_name}/{video_post.download_video_id}.mp4"
+    video_file = read_stored_video(engine, video_post)
+    if video_file is not None:
+        return video_file_name, video_file
+
     if not video_post.download_video_url:
         logger.info(f"download_video_url is none or video is not None, {video_post.pk}")
     logger.info(f"Starting download of the video, {video_post.download_video_url}")
 
-    response = requests.get(video_post.download_video_url, stream=True)
+    try:
+        video_file = engine.fetch(video_post.download_video_url)
+    except (requests.RequestException, OSError) as e:
+        logger.error(f"Response error,  url: {video_post.download_video_url}, {e}")
+        return
 
-    if response.status_code == 200:
-        logger.info(
-            f"Starting download of the video, response: 200, {video_post.download_video_url}"
+    logger.info(f"Successfully downloaded video {video_post.download_video_url}")
+    try:
+        store_video(video_post, video_file)
+    except (BotoCoreError, ClientError, OSError) as e:
+        # The next archive run downloads it again, this one still archives it
+        logger.warning(
+            f"Failed to store video {video_post.pk}, archiving it anyway: {e}"
         )
-        video_file_name = f"{profile.profile_name}/{video_post.download_video_id}.mp4"
+    except BaseException:
+        video_file.close()
+        raise
+    return video_file_name, video_file
+
+
+def pending_videos():
+    """Videos still to be archived: new ones and failed ones with attempts left."""
+    pending = Q(status=VideoPost.STATUS_CREATED)
+    pending |= Q(
+        status=VideoPost.STATUS_FAILED,
+        download_attempts__lt=settings.VIDEO_DOWNLOAD_MAX_ATTEMPTS,
+    )
+    return pending
 
-        video_file = ContentFile(response.content)
 
-        logger.info(f"Successfully downloaded video {video_post.download_video_url}")
-        return video_file_name, video_file
-    else:
-        logger.error(f"Response error,  url: {video_post.download_video_url}")
+def archive_video_posts(profile):
+    """Pending videos of the profile and the ones already in the per-video store."""
+    archived = pending_videos() | ~Q(video_object="")
+    return VideoPost.objects.filter(archived, profile=profile)
 
 
-def download_and_archive_videos(profile: Profile):
-    logger.info(f"Started archiving videos for profile {profile}")
-    video_posts = VideoPost.objects.filter(
-        retrieved_from_post__profile_url=profile, status=VideoPost.STATUS_CREATED
+def mark_videos_uploaded(video_post_ids, batch_size=1000):
+    for i in range(0, len(video_post_ids), batch_size):
+        VideoPost.objects.filter(pk__in=video_post_ids[i : i + batch_size]).update(
+            status=VideoPost.STATUS_UPLOADED, updated_at=timezone.now()
+        )
+
+
+def mark_video_failed(video_post):
+    VideoPost.objects.filter(pk=video_post.pk).update(
+        status=VideoPost.STATUS_FAILED,
+        download_attempts=F("download_attempts") + 1,
+        updated_at=timezone.now(),
     )
+    if video_post.download_attempts + 1 >= settings.VIDEO_DOWNLOAD_MAX_ATTEMPTS:
+        logger.warning(f"Giving up on downloading VideoPost {video_post.pk}")
+
+
+def video_posts_by_ids(video_post_ids, batch_size=1000):
+    for i in range(0, len(video_post_ids), batch_size):
+        yield from VideoPost.objects.filter(pk__in=video_post_ids[i : i + batch_size])
+
 
-    # Create a BytesIO object to store the zip archive in memory
-    in_memory_zip = BytesIO()
-    threads = []
-    for video_post in video_posts:
-        thread = ThreadWithReturnValue(
-            target=download_video, args=(profile, video_post)
+def archive_file_name(profile, suffix=""):
+    timestamp = datetime.datetime.now().strftime("%Y-%m-%d-%H%M%S")
+    return profile.video_archive.field.generate_filename(
+        profile, f"{profile.profile_name}/{timestamp}{suffix}.zip"
+    )
+
+
+def write_video_entries(profile, video_posts, zipf, job_id=None):
+    """
+    Download ``video_posts`` and write each one to ``zipf`` as it completes.
+    Returns the ids of the archived ones; the others are marked as failed.
+    """
+    archived = []
+    with DownloadEngine() as engine:
+        # Entries are written in completion order, so one slow download
+        # doesn't hold back every finished one behind it
+        results = engine.imap_unordered(
+            lambda video_post: (
+                video_post,
+                download_video(engine, profile, video_post),
+            ),
+            video_posts,
         )
-        thread.start()
-        threads.append(thread)
+        for video_post, result in results:
+            if not result:
+                mark_video_failed(video_post)
+                continue
+            video_file_name, video_file = result
+            with track("archive_write") as tracker, video_file, zipf.open(
+                video_file_name, "w", force_zip64=True
+            ) as entry:
+                video_file.copy_to(entry)
+                tracker.add(items=1, nbytes=video_file.size)
+            if video_post.status == VideoPost.STATUS_CREATED:
+                ScrapeJob.advance(job_id, videos_archived=1)
+            Profile.advance_archive(
+                profile.pk,
+                archive_videos_done=1,
+                archive_bytes=video_file.size,
+            )
+            count_profile(profile, "videos_archived", 1)
+            count_profile(profile, "archived_bytes", video_file.size)
+            archived.append(str(video_post.pk))
+        logger.info(f"Downloaded videos for profile {profile}: {engine.stats}")
+    return archived
 
-    with ZipFile(in_memory_zip, "w") as zipf:
-        for thread in threads:
-            result = thread.join()
-            if result:
-                video_file_name, video_file = result
-                # Add the video file to the ZIP file
-                zipf.writestr(video_file_name, video_file.read())
 
-    # Position the cursor at the start of the BytesIO object
-    in_memory_zip.seek(0)
+def download_and_archive_videos(profile: Profile, job_id=None):
+    logger.info(f"Started archiving videos for profile {profile}")
+    video_posts = archive_video_posts(profile)
+    if not video_posts.filter(pending_videos()).exists():
+        # The previous archive already has every stored video
+        logger.info(f"No new videos to archive for profile {profile}")
+        return
+    Profile.objects.filter(pk=profile.pk).update(
+        archive_videos_total=video_posts.count()
+    )
 
-    # Save the zip archive to the video_archive field of the MusicPost
-    archive_name = f"{profile.profile_name}/{datetime.datetime.now().strftime('%Y-%m-%d-%H%M%S')}.zip"
-    profile.video_archive.save(archive_name, ContentFile(in_memory_zip.getvalue()))
+    # Stream the ZIP straight into an S3 multipart upload instead of building it in memory
+    with profile.video_archive.storage.open_multipart_writer(
+        archive_file_name(profile)
+    ) as stream:
+        with ZipFile(stream, "w", allowZip64=True) as zipf:
+            archived = write_video_entries(
+                profile, video_posts.iterator(), zipf, job_id
+            )
 
-    # Close the BytesIO object
-    in_memory_zip.close()
+    # Save the zip archive to the video_archive field of the Profile
+    profile.video_archive.name = stream.name
+    profile.save(update_fields=["video_archive", "updated_at"])
 
     logger.info(f"Successfully archived videos for profile {profile}")
-    video_posts.update(status=VideoPost.STATUS_UPLOADED)
+    # Only now that the archive is complete
+    mark_videos_uploaded(archived)
     gc.collect()
+
+
+def available_workers(app):
+    """
+    Worker processes to spread archive shards over: ``ARCHIVE_SHARD_WORKERS``,
+    or the pool sizes reported by the running Celery workers.
+    """
+    if settings.ARCHIVE_SHARD_WORKERS:
+        return settings.ARCHIVE_SHARD_WORKERS
+    try:
+        stats = app.control.inspect(timeout=1).stats() or {}
+    except Exception:
+        logger.exception("Failed to ask the Celery workers for their pool sizes")
+        return 1
+    return sum(
+        worker.get("pool", {}).get("max-concurrency", 1) for worker in stats.values()
+    )
+
+
+def archive_shard_count(app, videos_total):
+    """One shard per ``ARCHIVE_SHARD_MIN_VIDEOS`` videos, at most one per available worker."""
+    shards = min(
+        videos_total // settings.ARCHIVE_SHARD_MIN_VIDEOS, settings.ARCHIVE_MAX_SHARDS
+    )
+    if shards <= 1:
+        return 1
+    return max(min(shards, available_workers(app)), 1)
+
+
+def start_sharded_archive(profile, shards, job_id=None, slot_token=None):
+    """
+    Split the archive of ``profile`` into ``shards`` ZIPs packaged by parallel
+    archive_shard tasks and joined by assemble_archive.
+    """
+    video_post_ids = [
+        str(pk) for pk in archive_video_posts(profile).values_list("pk", flat=True)
+    ]
+    Profile.objects.filter(pk=profile.pk).update(
+        archive_videos_total=len(video_post_ids)
+    )
+    shard_names = [
+        archive_file_name(profile, f"-shard{index}") for index in range(shards)
+    ]
+    logger.info(
+        f"Archiving {len(video_post_ids)} videos for profile {profile} in {shards} shards"
+    )
+    header = group(
+        archive_shard.s(str(profile.pk), name, video_post_ids[index::shards], job_id)
+        for index, name in enumerate(shard_names)
+    )
+    callback = assemble_archive.s(
+        str(profile.pk), archive_file_name(profile), job_id, slot_token
+    )
+    callback.on_error(
+        archive_shards_failed.s(str(profile.pk), shard_names, job_id, slot_token)
+    )
+    chord(header)(callback)
+
+
+@shared_task(acks_late=True)
+def archive_shard(profile_id, shard_name, video_post_ids, job_id=None):
+    """Package one shard of a sharded archive as a ZIP object of its own."""
+    profile = Profile.objects.get(id=profile_id)
+    with profile.video_archive.storage.open_multipart_writer(shard_name) as stream:
+        with ZipFile(stream, "w", allowZip64=True) as zipf:
+            archived = write_video_entries(
+                profile, video_posts_by_ids(video_post_ids), zipf, job_id
+            )
+    return {
+        "name": stream.name,
+        # The entries end where the shard's own central directory starts
+        "size": zipf.start_dir,
+        "entries": [zip_entry(info) for info in zipf.infolist()],
+        "video_post_ids": archived,
+    }
+
+
+@shared_task(acks_late=True)
+def assemble_archive(shards, profile_id, archive_name, job_id=None, slot_token=None):
+    """
+    Join the shard ZIPs into one archive on S3: their entries are copied
+    server-side, followed by a central directory covering all of them.
+    """
+    profile = Profile.objects.get(id=profile_id)
+    storage = profile.video_archive.storage
+    infos = []
+    with storage.open_multipart_writer(archive_name) as stream:
+        for shard in shards:
+            offset = stream.tell()
+            stream.copy_range(storage.get_object(shard["name"]), 0, shard["size"])
+            infos += [zip_info(entry, offset) for entry in shard["entries"]]
+        write_central_directory(stream, infos)
+
+    profile.video_archive.name = stream.name
+    profile.save(update_fields=["video_archive", "updated_at"])
+    logger.info(f"Assembled archive of profile {profile} from {len(shards)} shards")
+
+    for shard in shards:
+        storage.delete(shard["name"])
+        mark_videos_uploaded(shard["video_post_ids"])
+    finish_archive(profile_id, job_id)
+    archive_slots().release(slot_token)
+
+
+@shared_task
+def archive_shards_failed(
+    request, exc, traceback, profile_id, shard_names, job_id=None, slot_token=None
+):
+    """Error callback of a sharded archive: fail it, free its slot and drop the shards."""
+    logger.error(f"Sharded archive of profile {profile_id} failed: {exc}")
+    fail_archive(profile_id, job_id, exc)
+    archive_slots().release(slot_token)
+    storage = Profile._meta.get_field("video_archive").storage
+    for name in shard_names:
+        storage.delete(name)
@@ -0,0 +1,113 @@
+import io
+import json
+from unittest import skipIf, skipUnless
+from zipfile import ZipFile
+
+from django.db import connection
+from django.test import SimpleTestCase, TestCase
+
+from tiktokparser.utils.archives import write_central_directory, zip_entry, zip_info
+
+from .models import MusicPost, Profile, VideoPost
+
+
+class VideoPostTestMixin:
+    def setUp(self):
+        profile = Profile.objects.create(url="https://www.tiktok.com/@tests")
+        self.music_post = MusicPost.objects.create(
+            author="tests",
+            text="",
+            music_url="https://www.tiktok.com/music/tests-1",
+            profile_url=profile,
+        )
+
+    def video_post(self, download_video_id):
+        return VideoPost(
+            retrieved_from_post=self.music_post, download_video_id=download_video_id
+        )
+
+
+@skipUnless(connection.vendor == "postgresql", "INSERT ... RETURNING path")
+class InsertReturningNewTests(VideoPostTestMixin, TestCase):
+    def test_conflict_within_batch(self):
+        first, repeat = self.video_post("1"), self.video_post("1")
+        inserted_pks = VideoPost.objects.all()._insert_returning_new(
+            [first, repeat], batch_size=1000
+        )
+        self.assertEqual(inserted_pks, {first.pk})
+        self.assertEqual(VideoPost.objects.count(), 1)
+
+    def test_conflict_with_existing_row(self):
+        existing = VideoPost.objects.create(
+            retrieved_from_post=self.music_post, download_video_id="1"
+        )
+        new = self.video_post("2")
+        inserted = VideoPost.objects.bulk_create_new(
+            [self.video_post("1"), new], batch_size=1
+        )
+        self.assertEqual(inserted, [new])
+        self.assertFalse(new._state.adding)
+        self.assertEqual(
+            set(VideoPost.objects.values_list("pk", flat=True)), {existing.pk, new.pk}
+        )
+
+
+@skipIf(connection.vendor == "postgresql", "uses INSERT ... RETURNING instead")
+class BulkCreateNewFallbackTests(VideoPostTestMixin, TestCase):
+    def test_returns_only_new_rows(self):
+        existing = VideoPost.objects.create(
+            retrieved_from_post=self.music_post, download_video_id="1"
+        )
+        new = [self.video_post("2"), self.video_post("3")]
+        inserted = VideoPost.objects.bulk_create_new(
+            [self.video_post("1"), new[0], self.video_post("2"), new[1]]
+        )
+        self.assertEqual(inserted, new)
+        self.assertTrue(all(not obj._state.adding for obj in inserted))
+        self.assertEqual(
+            set(VideoPost.objects.values_list("pk", flat=True)),
+            {existing.pk, new[0].pk, new[1].pk},
+        )
+
+
+class _StreamingBuffer(io.BytesIO):
+    """Cannot seek, like the S3 multipart writer, so entries use data descriptors."""
+
+    def seek(self, *args):
+        raise OSError("not seekable")
+
+
+class ShardAssemblyTests(SimpleTestCase):
+    def write_shard(self, files):
+        stream = _StreamingBuffer()
+        with ZipFile(stream, "w", allowZip64=True) as zipf:
+            for name, data in files.items():
+                with zipf.open(name, "w") as entry:
+                    entry.write(data)
+        # What archive_shard passes on to assemble_archive through the broker
+        shard = {
+            "size": zipf.start_dir,
+            "entries": [zip_entry(info) for info in zipf.infolist()],
+        }
+        return stream.getvalue(), json.loads(json.dumps(shard))
+
+    def test_round_trip(self):
+        shard_files = [
+            {"a.mp4": b"a" * 1000, "b.mp4": b"b" * 10},
+            {"c.mp4": b""},
+            {"d.mp4": bytes(range(256)) * 40},
+        ]
+        stream, infos = _StreamingBuffer(), []
+        for files in shard_files:
+            data, shard = self.write_shard(files)
+            offset = stream.tell()
+            stream.write(data[: shard["size"]])
+            infos += [zip_info(entry, offset) for entry in shard["entries"]]
+        write_central_directory(stream, infos)
+
+        with ZipFile(io.BytesIO(stream.getvalue())) as zipf:
+            self.assertIsNone(zipf.testzip())
+            self.assertEqual(
+                {info.filename: zipf.read(info) for info in zipf.infolist()},
+                {name: data for files in shard_files for name, data in files.items()},
+            )
@@ -1,6 +1,6 @@
 from django.urls import path
 
-from .views import TriggerTikTokScrapper
+from .views import ScrapeJobDetail, TriggerTikTokScrapper
 
 urlpatterns = [
     path(
@@ -8,4 +8,9 @@ urlpatterns = [
         TriggerTikTokScrapper.as_view(),
         name="trigger-tiktok-scrapper",
     ),
+    path(
+        "scrape-jobs/<uuid:pk>/",
+        ScrapeJobDetail.as_view(),
+        name="scrape-job-detail",
+    ),
 ]
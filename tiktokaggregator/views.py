@@ -1,15 +1,16 @@
 # myapp/views.py
 import logging
-import time
 
+from django.http import HttpResponse
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+from rest_framework import status
+from rest_framework.generics import RetrieveAPIView
 from rest_framework.response import Response
 from rest_framework.views import APIView
 
-from tiktokparser.celery import app
-from .models import MusicPost, Profile
-from .serializers import TikTokScrapperInputSerializer
-from .tasks import process_tiktok_data, download_and_archive_videos
-from celery.result import AsyncResult
+from .models import MusicPost, Profile, ScrapeJob
+from .serializers import ScrapeJobSerializer, TikTokScrapperInputSerializer
+from .tasks import process_tiktok_data
 
 logger = logging.getLogger(__name__)
 
@@ -22,17 +23,21 @@ class TriggerTikTokScrapper(APIView):
         serializer.is_valid(raise_exception=True)
         validated_data = serializer.validated_data
 
-        # Trigger the Celery task
-        res = process_tiktok_data.delay(validated_data)
-        async_res = AsyncResult(res.id, app=app)
-        while True:
-            if async_res.state == "SUCCESS":
-                logger.info("Starting download_and_archive_videos")
-                profile = Profile.objects.get(url=validated_data["profiles"][0])
-                download_and_archive_videos(profile)
-                logger.info("Finished download_and_archive_videos")
-                return Response({"status": "Scraping task finished"})
-            if async_res.state == "FAILED":
-                logger.error("Failed to parse posts")
-                return Response({"status": "Scraping task had some errors, check admin page"})
-            time.sleep(10)
+        profile, _ = Profile.objects.get_or_create(url=validated_data["profiles"][0])
+        job = ScrapeJob.objects.create(profile=profile, run_input=validated_data)
+        job_id = str(job.id)
+
+        # The archive step is queued by the workers once every sound is processed
+        process_tiktok_data.delay(validated_data, job_id)
+        logger.info(f"Queued {job}")
+        return Response(ScrapeJobSerializer(job).data, status=status.HTTP_202_ACCEPTED)
+
+
+class ScrapeJobDetail(RetrieveAPIView):
+    queryset = ScrapeJob.objects.select_related("profile")
+    serializer_class = ScrapeJobSerializer
+
+
+def metrics(request):
+    """Prometheus scrape endpoint for the metrics of this process."""
+    return HttpResponse(generate_latest(), content_type=CONTENT_TYPE_LATEST)
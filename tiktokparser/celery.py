@@ -1,6 +1,7 @@
 import os
 
 from celery import Celery
+from celery.signals import worker_ready
 from django.conf import settings
 
 # set the default Django settings module for the 'celery' program.
@@ -16,3 +17,10 @@ app.config_from_object(settings, namespace="CELERY")
 
 # Load task modules from all registered Django app configs.
 app.autodiscover_tasks()
+
+
+@worker_ready.connect
+def start_metrics_server(**kwargs):
+    from tiktokparser.utils.metrics import start_worker_metrics_server
+
+    start_worker_metrics_server()
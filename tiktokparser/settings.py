@@ -170,6 +170,36 @@ CELERY_TASK_SERIALIZER = "json"
 CELERY_RESULT_SERIALIZER = "json"
 CELERY_TIMEZONE = TIME_ZONE
 CELERY_TASK_DEFAULT_QUEUE = "default"
+# asyncio does not mix with the eventlet pool, async tasks need a prefork/solo worker
+CELERY_TASK_ROUTES = {
+    "tiktokaggregator.tasks.process_sounds_async_task": {"queue": "apify_async"},
+}
+# Redis redelivers an unacknowledged task after the visibility timeout (1h by
+# default); it has to outlast the longest acks_late task (archives, sounds)
+CELERY_BROKER_TRANSPORT_OPTIONS = {
+    "visibility_timeout": env.int(
+        "CELERY_VISIBILITY_TIMEOUT", default=12 * 60 * 60
+    ),  # seconds
+}
+CELERY_BEAT_SCHEDULE = {
+    "resume-stale-sounds": {
+        "task": "tiktokaggregator.tasks.resume_stale_sounds",
+        "schedule": env.int(
+            "SOUND_PROCESSING_SWEEP_INTERVAL", default=10 * 60
+        ),  # seconds
+    },
+    "retry-failed-videos": {
+        "task": "tiktokaggregator.tasks.retry_failed_videos",
+        "schedule": env.int(
+            "VIDEO_DOWNLOAD_RETRY_INTERVAL", default=60 * 60
+        ),  # seconds
+    },
+}
+# METRICS
+# Prometheus metrics, served by the web app at /metrics/ and by each Celery worker
+METRICS_ENABLED = env.bool("METRICS_ENABLED", default=True)
+METRICS_WORKER_PORT = env.int("METRICS_WORKER_PORT", default=9808)  # 0 disables
+
 # TOKENS
 AUTH_TOKEN = os.getenv("AUTH_TOKEN")
 
@@ -227,6 +257,110 @@ STATICFILES_STORAGE = "tiktokparser.utils.storages.StaticS3Storage"
 # ------------------------------------------------------------------------------
 MEDIA_URL = f"https://{aws_s3_domain}/media/"
 DEFAULT_FILE_STORAGE = "tiktokparser.utils.storages.MediaS3Storage"
+# Size of each S3 multipart part when streaming profile archives (S3 minimum is 5MB)
+ARCHIVE_UPLOAD_PART_SIZE = env.int(
+    "ARCHIVE_UPLOAD_PART_SIZE",
+    default=16 * 1024 * 1024,  # 16MB
+)
 
 # APIFY
 APIFY_API_TOKEN = env.str("APIFY_API_TOKEN")
+# Finished actor runs are reused for identical run inputs within this many seconds (0 disables)
+APIFY_RUN_CACHE_TTL = env.int("APIFY_RUN_CACHE_TTL", default=15 * 60)
+APIFY_RUN_CACHE_MAX_ENTRIES = env.int("APIFY_RUN_CACHE_MAX_ENTRIES", default=1000)
+# Items per dataset page; pages only carry the fields each client declares
+APIFY_DATASET_PAGE_SIZE = env.int("APIFY_DATASET_PAGE_SIZE", default=10000)
+# "live", "record" (also save runs, items and KV records as fixtures) or "replay" (serve fixtures offline)
+APIFY_MODE = env.str("APIFY_MODE", default="live")
+APIFY_FIXTURES_DIR = env.str(
+    "APIFY_FIXTURES_DIR", default=str(BASE_DIR / "fixtures" / "apify")
+)
+# Replay at this multiple of the recorded speed, 0 replays as fast as possible
+APIFY_REPLAY_SPEED = env.float("APIFY_REPLAY_SPEED", default=0.0)
+# Process sounds in batches with the asyncio Apify client (see process_sounds_async_task)
+APIFY_ASYNC_MODE = env.bool("APIFY_ASYNC_MODE", default=False)
+
+# VIDEO DOWNLOADS
+VIDEO_DOWNLOAD_WORKERS = env.int("VIDEO_DOWNLOAD_WORKERS", default=16)
+VIDEO_DOWNLOAD_MAX_CONNECTIONS_PER_HOST = env.int(
+    "VIDEO_DOWNLOAD_MAX_CONNECTIONS_PER_HOST", default=8
+)
+VIDEO_DOWNLOAD_TIMEOUT = env.int("VIDEO_DOWNLOAD_TIMEOUT", default=60)  # seconds
+# Downloaded bytes allowed to wait for the archive writer before new downloads pause
+VIDEO_DOWNLOAD_MAX_BUFFERED_BYTES = env.int(
+    "VIDEO_DOWNLOAD_MAX_BUFFERED_BYTES",
+    default=512 * 1024 * 1024,  # 512MB
+)
+# Videos larger than this are spilled to temporary files in VIDEO_DOWNLOAD_SPOOL_DIR
+VIDEO_DOWNLOAD_SPOOL_THRESHOLD = env.int(
+    "VIDEO_DOWNLOAD_SPOOL_THRESHOLD",
+    default=8 * 1024 * 1024,  # 8MB
+)
+VIDEO_DOWNLOAD_SPOOL_DIR = env.str("VIDEO_DOWNLOAD_SPOOL_DIR", default=None)
+# Tries per download within an archive run; retries resume with a Range request
+VIDEO_DOWNLOAD_MAX_TRIES = env.int("VIDEO_DOWNLOAD_MAX_TRIES", default=5)
+# Archive runs that may retry a failed video before it is given up on
+VIDEO_DOWNLOAD_MAX_ATTEMPTS = env.int("VIDEO_DOWNLOAD_MAX_ATTEMPTS", default=3)
+
+# PROFILE CRAWLS
+# Only fetch posts newer than the previous crawl of a profile
+PROFILE_CRAWL_INCREMENTAL = env.bool("PROFILE_CRAWL_INCREMENTAL", default=True)
+# Pinned posts shown above newer ones, skipped before a crawl stops at seen posts
+PROFILE_CRAWL_PINNED_POSTS = env.int("PROFILE_CRAWL_PINNED_POSTS", default=3)
+
+# SCRAPE PIPELINE
+# Posts per chunk and chunks buffered between two stages of process_tiktok_data
+SCRAPE_PIPELINE_CHUNK_SIZE = env.int("SCRAPE_PIPELINE_CHUNK_SIZE", default=500)
+SCRAPE_PIPELINE_QUEUE_SIZE = env.int("SCRAPE_PIPELINE_QUEUE_SIZE", default=4)
+# Worker threads per stage
+SCRAPE_PIPELINE_NORMALIZE_WORKERS = env.int(
+    "SCRAPE_PIPELINE_NORMALIZE_WORKERS", default=1
+)
+SCRAPE_PIPELINE_DEDUP_WORKERS = env.int("SCRAPE_PIPELINE_DEDUP_WORKERS", default=2)
+SCRAPE_PIPELINE_INSERT_WORKERS = env.int("SCRAPE_PIPELINE_INSERT_WORKERS", default=2)
+SCRAPE_PIPELINE_DISPATCH_WORKERS = env.int(
+    "SCRAPE_PIPELINE_DISPATCH_WORKERS", default=1
+)
+
+# SOUND PROCESSING
+# Max number of process_sound_data_task running at once across all workers
+SOUND_PROCESSING_CONCURRENCY = env.int("SOUND_PROCESSING_CONCURRENCY", default=20)
+SOUND_PROCESSING_SLOT_TIMEOUT = env.int(
+    "SOUND_PROCESSING_SLOT_TIMEOUT", default=2 * 60 * 60
+)  # seconds
+SOUND_PROCESSING_SLOT_RETRY_DELAY = env.int(
+    "SOUND_PROCESSING_SLOT_RETRY_DELAY", default=15
+)  # seconds
+SOUND_PROCESSING_MAX_RETRIES = env.int("SOUND_PROCESSING_MAX_RETRIES", default=3)
+# Pending sounds without a checkpoint heartbeat for this long are resumed by resume_stale_sounds
+SOUND_PROCESSING_STALE_AFTER = env.int(
+    "SOUND_PROCESSING_STALE_AFTER", default=3 * 60 * 60
+)  # seconds
+# Async mode: sounds per process_sounds_async_task and concurrent actor runs within it
+SOUND_PROCESSING_ASYNC_BATCH_SIZE = env.int(
+    "SOUND_PROCESSING_ASYNC_BATCH_SIZE", default=100
+)
+SOUND_PROCESSING_ASYNC_CONCURRENCY = env.int(
+    "SOUND_PROCESSING_ASYNC_CONCURRENCY", default=20
+)
+VIDEO_DOWNLOAD_ASYNC_CONCURRENCY = env.int(
+    "VIDEO_DOWNLOAD_ASYNC_CONCURRENCY", default=5
+)
+# Video URLs from concurrent sound jobs are resolved together in one download actor run
+VIDEO_DOWNLOAD_BATCH_SIZE = env.int("VIDEO_DOWNLOAD_BATCH_SIZE", default=1000)
+VIDEO_DOWNLOAD_BATCH_MAX_WAIT = env.float(
+    "VIDEO_DOWNLOAD_BATCH_MAX_WAIT", default=5.0
+)  # seconds
+
+# ARCHIVES
+# Max number of archive_profile_videos running at once across all workers
+ARCHIVE_CONCURRENCY = env.int("ARCHIVE_CONCURRENCY", default=4)
+ARCHIVE_SLOT_TIMEOUT = env.int("ARCHIVE_SLOT_TIMEOUT", default=6 * 60 * 60)  # seconds
+ARCHIVE_SLOT_RETRY_DELAY = env.int("ARCHIVE_SLOT_RETRY_DELAY", default=30)  # seconds
+# Queued or running archives without progress for this long can be started again
+ARCHIVE_STALE_AFTER = env.int("ARCHIVE_STALE_AFTER", default=30 * 60)  # seconds
+# Large archives are split into shards packaged on different workers and joined on S3
+ARCHIVE_SHARD_MIN_VIDEOS = env.int("ARCHIVE_SHARD_MIN_VIDEOS", default=1000)
+ARCHIVE_MAX_SHARDS = env.int("ARCHIVE_MAX_SHARDS", default=16)
+# Worker processes to spread shards over, 0 asks the running Celery workers
+ARCHIVE_SHARD_WORKERS = env.int("ARCHIVE_SHARD_WORKERS", default=0)
@@ -16,7 +16,10 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import include, path
 
+from tiktokaggregator.views import metrics
+
 urlpatterns = [
     path("admin/", admin.site.urls),
+    path("metrics/", metrics, name="metrics"),
     path("parser/apify/", include("tiktokaggregator.urls")),
 ]
@@ -0,0 +1,43 @@
+from zipfile import ZipFile, ZipInfo
+
+# Everything the central directory needs to know about an entry
+_ENTRY_FIELDS = (
+    "filename",
+    "date_time",
+    "compress_type",
+    "CRC",
+    "compress_size",
+    "file_size",
+    "header_offset",
+    "flag_bits",
+    "create_system",
+    "create_version",
+    "extract_version",
+    "external_attr",
+)
+
+
+def zip_entry(info):
+    """JSON-serializable form of a written ``ZipInfo``."""
+    return {field: getattr(info, field) for field in _ENTRY_FIELDS}
+
+
+def zip_info(entry, offset=0):
+    """Rebuild a ``ZipInfo`` from ``zip_entry``, with its local header moved by ``offset``."""
+    info = ZipInfo(entry["filename"], tuple(entry["date_time"]))
+    for field in _ENTRY_FIELDS[2:]:
+        setattr(info, field, entry[field])
+    info.header_offset += offset
+    return info
+
+
+def write_central_directory(stream, infos):
+    """
+    Finish a ZIP whose entries were written to ``stream`` by other means
+    (e.g. concatenated from several ZIPs): write the central directory for
+    ``infos`` at the current position of ``stream``.
+    """
+    zipf = ZipFile(stream, "w", allowZip64=True)
+    zipf.filelist = list(infos)
+    zipf.NameToInfo = {info.filename: info for info in zipf.filelist}
+    zipf.close()
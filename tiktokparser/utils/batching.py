@@ -0,0 +1,105 @@
+import logging
+import threading
+import time
+from concurrent.futures import Future
+
+logger = logging.getLogger(__name__)
+
+
+class _BatchRequest:
+    def __init__(self, keys):
+        self.keys = keys
+        self.future = Future()
+        self.results = []
+        self.submitted_at = time.monotonic()
+
+
+class BatchCoalescer:
+    """
+    Merges work submitted by many concurrent callers into large batches.
+
+    ``submit()`` takes ``(key, value)`` pairs and returns a future. A background thread waits until
+    ``batch_size`` values are pending or the oldest request has waited
+    ``max_wait`` seconds, calls ``execute(values)`` once for the whole batch and
+    resolves every future with the results whose ``result_key(result)`` is one
+    of the keys that caller submitted.
+    """
+
+    def __init__(self, execute, result_key, batch_size, max_wait):
+        self.execute = execute
+        self.result_key = result_key
+        self.batch_size = batch_size
+        self.max_wait = max_wait
+        self._pending = []
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def submit(self, values_by_key):
+        request = _BatchRequest(dict(values_by_key))
+        if not request.keys:
+            request.future.set_result([])
+            return request.future
+        with self._condition:
+            self._pending.append(request)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._run, name="batch-coalescer", daemon=True
+                )
+                self._thread.start()
+            self._condition.notify()
+        return request.future
+
+    def _pending_size(self):
+        return sum(len(request.keys) for request in self._pending)
+
+    def _next_batch(self):
+        with self._condition:
+            while not self._pending:
+                self._condition.wait()
+            deadline = self._pending[0].submitted_at + self.max_wait
+            while self._pending_size() < self.batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                self._condition.wait(timeout)
+            batch, size = [], 0
+            while self._pending:
+                request = self._pending[0]
+                if batch and size + len(request.keys) > self.batch_size:
+                    break
+                batch.append(self._pending.pop(0))
+                size += len(request.keys)
+            return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            try:
+                self._execute(batch)
+            except Exception as e:
+                for request in batch:
+                    request.future.set_exception(e)
+
+    def _execute(self, batch):
+        requests_by_key = {}
+        for request in batch:
+            for key in request.keys:
+                requests_by_key.setdefault(key, []).append(request)
+        values = list(
+            {
+                key: value for request in batch for key, value in request.keys.items()
+            }.values()
+        )
+        logger.info(f"Running a batch of {len(values)} for {len(batch)} requests")
+
+        for result in self.execute(values):
+            if len(batch) == 1:
+                batch[0].results.append(result)
+                continue
+            routed = requests_by_key.get(self.result_key(result))
+            if not routed:
+                logger.warning(f"Could not route batch result {result}")
+            for request in routed or ():
+                request.results.append(result)
+        for request in batch:
+            request.future.set_result(request.results)
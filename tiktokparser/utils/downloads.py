@@ -0,0 +1,355 @@
+import contextlib
+import mmap
+import os
+import tempfile
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from io import BytesIO
+from urllib.parse import urlparse
+from urllib.request import url2pathname
+
+import backoff
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+from tiktokparser.utils.metrics import track
+
+CHUNK_SIZE = 1024 * 1024
+
+
+class IncompleteDownload(requests.RequestException):
+    """The body ended before reaching the size announced for it."""
+
+
+def _retryable(e):
+    if isinstance(e, requests.HTTPError):
+        status = e.response.status_code
+        return status >= 500 or status == 429
+    return isinstance(
+        e,
+        (
+            requests.ConnectionError,
+            requests.Timeout,
+            requests.exceptions.ChunkedEncodingError,
+            IncompleteDownload,
+        ),
+    )
+
+
+def _expected_size(response, offset):
+    """Full size of the body announced by ``response``, ``None`` if unknown."""
+    content_range = response.headers.get("Content-Range")
+    if response.status_code == 206 and content_range:
+        total = content_range.rsplit("/", 1)[-1]
+        return None if total == "*" else int(total)
+    length = response.headers.get("Content-Length")
+    return offset + int(length) if length else None
+
+
+class SpooledDownload:
+    """
+    Download body kept in memory up to ``threshold`` bytes and spilled to an
+    anonymous temporary file beyond that.
+    """
+
+    def __init__(self, threshold, dir=None):
+        self.size = 0
+        self._threshold = threshold
+        self._dir = dir
+        self._buffer = BytesIO()
+        self._file = None
+
+    @property
+    def in_memory(self):
+        return self.size if self._file is None else 0
+
+    def _spill(self):
+        self._file = tempfile.TemporaryFile(dir=self._dir)
+        self._file.write(self._buffer.getbuffer())
+        self._buffer = None
+
+    def truncate(self):
+        """Drop everything written so far."""
+        if self._file is None:
+            self._buffer = BytesIO()
+        else:
+            self._file.seek(0)
+            self._file.truncate()
+        self.size = 0
+
+    def reserve(self, expected_size):
+        if self._file is None and expected_size > self._threshold:
+            self._spill()
+
+    def write(self, chunk):
+        if self._file is None and self.size + len(chunk) > self._threshold:
+            self._spill()
+        (self._buffer if self._file is None else self._file).write(chunk)
+        self.size += len(chunk)
+
+    def reader(self):
+        """The body as a readable file at its start, read in place without a copy."""
+        source = self._buffer if self._file is None else self._file
+        source.flush()
+        source.seek(0)
+        return source
+
+    def copy_to(self, stream):
+        """Write the body to ``stream`` from a buffer view or mmap, without copying it."""
+        if self._file is None:
+            with self._buffer.getbuffer() as view:
+                stream.write(view)
+            return
+        if not self.size:
+            return
+        self._file.flush()
+        with mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            with memoryview(mapped) as view:
+                stream.write(view)
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+        self._buffer = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class DownloadStats:
+    def __init__(self):
+        self.files = 0
+        self.bytes = 0
+        self.started_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def record(self, size):
+        with self._lock:
+            self.files += 1
+            self.bytes += size
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started_at
+
+    @property
+    def files_per_second(self):
+        return self.files / self.elapsed if self.elapsed else 0.0
+
+    @property
+    def mb_per_second(self):
+        return self.bytes / 1024 / 1024 / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self):
+        return (
+            f"{self.files} files, {self.bytes / 1024 / 1024:.1f} MB in {self.elapsed:.1f}s "
+            f"({self.files_per_second:.2f} files/s, {self.mb_per_second:.2f} MB/s)"
+        )
+
+
+class DownloadEngine:
+    """
+    Bounded pool of download workers sharing keep-alive HTTP connections.
+
+    Every worker thread gets its own ``requests.Session`` but all of them mount
+    the same ``HTTPAdapter``, so connections are reused across workers and never
+    exceed ``max_connections_per_host`` for a single host.
+
+    Bodies larger than ``spool_threshold`` are spilled to temporary files in
+    ``spool_dir``. In-memory bytes fetched by a task stay charged against
+    ``max_buffered_bytes`` until the consumer of ``imap_unordered`` is done with
+    its result; no new downloads are started while the budget is exhausted.
+    """
+
+    def __init__(
+        self,
+        max_workers=None,
+        max_connections_per_host=None,
+        timeout=None,
+        max_buffered_bytes=None,
+        spool_threshold=None,
+        spool_dir=None,
+    ):
+        self.max_workers = max_workers or settings.VIDEO_DOWNLOAD_WORKERS
+        self.max_connections_per_host = (
+            max_connections_per_host or settings.VIDEO_DOWNLOAD_MAX_CONNECTIONS_PER_HOST
+        )
+        self.timeout = timeout or settings.VIDEO_DOWNLOAD_TIMEOUT
+        self.max_buffered_bytes = (
+            max_buffered_bytes or settings.VIDEO_DOWNLOAD_MAX_BUFFERED_BYTES
+        )
+        self.spool_threshold = (
+            spool_threshold or settings.VIDEO_DOWNLOAD_SPOOL_THRESHOLD
+        )
+        self.spool_dir = spool_dir or settings.VIDEO_DOWNLOAD_SPOOL_DIR
+        self.stats = DownloadStats()
+        self._buffered_bytes = 0
+        self._lock = threading.Lock()
+        self._adapter = HTTPAdapter(
+            pool_maxsize=self.max_connections_per_host, pool_block=True
+        )
+        self._local = threading.local()
+        self._executor = ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="video-download"
+        )
+
+    @property
+    def session(self):
+        session = getattr(self._local, "session", None)
+        if session is None:
+            session = requests.Session()
+            session.mount("http://", self._adapter)
+            session.mount("https://", self._adapter)
+            self._local.session = session
+        return session
+
+    @property
+    def buffered_bytes(self):
+        return self._buffered_bytes
+
+    def _charge(self, size):
+        self._local.charged = getattr(self._local, "charged", 0) + size
+        with self._lock:
+            self._buffered_bytes += size
+
+    def _release(self, size):
+        with self._lock:
+            self._buffered_bytes -= size
+
+    def fetch(self, url):
+        """
+        Download ``url`` in chunks and return the body as a ``SpooledDownload``.
+        ``file://`` URLs (replayed Apify records) are read from disk.
+        """
+        read = self._read_file if urlparse(url).scheme == "file" else self._read_url
+        return self._fetch("video_download", lambda body: read(url, body))
+
+    def fetch_object(self, obj):
+        """Read the S3 object ``obj`` (a boto3 ``s3.Object``) into a ``SpooledDownload``."""
+        return self._fetch(
+            "video_object_read", lambda body: self._read_object(obj, body)
+        )
+
+    def _fetch(self, stage, read):
+        body = SpooledDownload(self.spool_threshold, self.spool_dir)
+        try:
+            with track(stage) as tracker:
+                read(body)
+                tracker.add(items=1, nbytes=body.size)
+        except BaseException:
+            body.close()
+            raise
+        self.stats.record(body.size)
+        return body
+
+    @backoff.on_exception(
+        backoff.expo,
+        requests.RequestException,
+        max_tries=lambda: settings.VIDEO_DOWNLOAD_MAX_TRIES,
+        giveup=lambda e: not _retryable(e),
+    )
+    def _read_url(self, url, body):
+        """
+        Read ``url`` into ``body``. A retry after a broken transfer asks only
+        for the missing bytes with a Range request, and the result has to add
+        up to the size the server announced.
+        """
+        headers = {"Range": f"bytes={body.size}-"} if body.size else {}
+        with self.session.get(
+            url, stream=True, timeout=self.timeout, headers=headers
+        ) as response:
+            response.raise_for_status()
+            encoded = response.headers.get("Content-Encoding", "identity") != "identity"
+            if body.size and (response.status_code != 206 or encoded):
+                # The range was ignored (or can't be trusted), start over
+                self._truncate(body)
+            # Lengths of an encoded body don't match the decoded bytes
+            expected = None if encoded else _expected_size(response, body.size)
+            body.reserve(expected or 0)
+            self._write_chunks(body, response.iter_content(chunk_size=CHUNK_SIZE))
+        self._verify_size(url, body, expected)
+
+    def _read_object(self, obj, body):
+        response = obj.get()
+        expected = response.get("ContentLength")
+        body.reserve(expected or 0)
+        with contextlib.closing(response["Body"]) as source:
+            self._write_chunks(body, iter(lambda: source.read(CHUNK_SIZE), b""))
+        self._verify_size(obj.key, body, expected)
+
+    def _verify_size(self, source, body, expected):
+        if expected is not None and body.size != expected:
+            raise IncompleteDownload(
+                f"Read {body.size} of {expected} bytes from {source}"
+            )
+
+    def _truncate(self, body):
+        in_memory = body.in_memory
+        body.truncate()
+        self._charge(body.in_memory - in_memory)
+
+    def _read_file(self, url, body):
+        with open(url2pathname(urlparse(url).path), "rb") as source:
+            body.reserve(os.fstat(source.fileno()).st_size)
+            self._write_chunks(body, iter(lambda: source.read(CHUNK_SIZE), b""))
+
+    def _write_chunks(self, body, chunks):
+        for chunk in chunks:
+            in_memory = body.in_memory
+            body.write(chunk)
+            self._charge(body.in_memory - in_memory)
+
+    def _run(self, fn, item):
+        self._local.charged = 0
+        try:
+            return fn(item), self._local.charged
+        except BaseException:
+            self._release(self._local.charged)
+            raise
+
+    def _has_capacity(self, pending):
+        if len(pending) >= self.max_workers:
+            return False
+        return self._buffered_bytes < self.max_buffered_bytes
+
+    def imap_unordered(self, fn, items):
+        """
+        Run ``fn(item)`` on the worker pool and yield results as soon as they
+        complete. The bytes a result holds are released once the consumer asks
+        for the next one.
+        """
+        items = iter(items)
+        pending = set()
+        exhausted = False
+        while True:
+            while not exhausted and self._has_capacity(pending):
+                try:
+                    item = next(items)
+                except StopIteration:
+                    exhausted = True
+                    break
+                pending.add(self._executor.submit(self._run, fn, item))
+            if not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                result, charged = future.result()
+                try:
+                    yield result
+                finally:
+                    self._release(charged)
+
+    def close(self):
+        self._executor.shutdown(wait=True, cancel_futures=True)
+        self._adapter.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,51 @@
+import functools
+import time
+import uuid
+
+import redis
+from django.conf import settings
+
+_ACQUIRE_SCRIPT = """
+local key, limit, now, expires_at, token = KEYS[1], tonumber(ARGV[1]), ARGV[2], ARGV[3], ARGV[4]
+redis.call("ZREMRANGEBYSCORE", key, "-inf", now)
+if redis.call("ZCARD", key) < limit then
+    redis.call("ZADD", key, expires_at, token)
+    return 1
+end
+return 0
+"""
+
+
+@functools.lru_cache(maxsize=None)
+def get_redis():
+    return redis.Redis.from_url(settings.REDIS_URL)
+
+
+@functools.lru_cache(maxsize=None)
+def _acquire_script():
+    return get_redis().register_script(_ACQUIRE_SCRIPT)
+
+
+class ClusterSemaphore:
+    """
+    Counting semaphore shared by every web and Celery process using the same
+    Redis. Slots held longer than ``timeout`` seconds are considered leaked
+    (e.g. the holder was killed) and are reclaimed.
+    """
+
+    def __init__(self, name, limit, timeout):
+        self.key = f"semaphore:{name}"
+        self.limit = limit
+        self.timeout = timeout
+
+    def acquire(self):
+        """Return a token for a free slot, or ``None`` if all slots are taken."""
+        token = uuid.uuid4().hex
+        now = time.time()
+        acquired = _acquire_script()(
+            keys=[self.key], args=[self.limit, now, now + self.timeout, token]
+        )
+        return token if acquired else None
+
+    def release(self, token):
+        get_redis().zrem(self.key, token)
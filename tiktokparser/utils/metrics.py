@@ -0,0 +1,82 @@
+import contextlib
+import logging
+import time
+
+from django.conf import settings
+from prometheus_client import Counter, Gauge, Histogram, start_http_server
+
+logger = logging.getLogger(__name__)
+
+STAGE_SECONDS = Histogram(
+    "tiktokparser_stage_seconds",
+    "Time spent in one call of a stage",
+    ["stage"],
+    buckets=(0.01, 0.05, 0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600),
+)
+STAGE_ITEMS = Counter(
+    "tiktokparser_stage_items_total", "Items handled by a stage", ["stage"]
+)
+STAGE_BYTES = Counter(
+    "tiktokparser_stage_bytes_total", "Bytes handled by a stage", ["stage"]
+)
+STAGE_ERRORS = Counter(
+    "tiktokparser_stage_errors_total", "Stage calls that raised", ["stage"]
+)
+STAGE_IN_FLIGHT = Gauge(
+    "tiktokparser_stage_in_flight", "Stage calls currently running", ["stage"]
+)
+PROFILE_ITEMS = Counter(
+    "tiktokparser_profile_items_total",
+    "Posts, sounds, videos and archived bytes per profile",
+    ["profile", "kind"],
+)
+
+
+class _Tracker:
+    def __init__(self, stage):
+        self.stage = stage
+
+    def add(self, items=0, nbytes=0):
+        if items:
+            STAGE_ITEMS.labels(self.stage).inc(items)
+        if nbytes:
+            STAGE_BYTES.labels(self.stage).inc(nbytes)
+
+
+class _NullTracker:
+    def add(self, items=0, nbytes=0):
+        pass
+
+
+@contextlib.contextmanager
+def track(stage):
+    """
+    Time the block as one call of ``stage`` and count it as in flight. The
+    yielded tracker counts the items and bytes it handled.
+    """
+    if not settings.METRICS_ENABLED:
+        yield _NullTracker()
+        return
+    in_flight = STAGE_IN_FLIGHT.labels(stage)
+    in_flight.inc()
+    started = time.perf_counter()
+    try:
+        yield _Tracker(stage)
+    except BaseException:
+        STAGE_ERRORS.labels(stage).inc()
+        raise
+    finally:
+        STAGE_SECONDS.labels(stage).observe(time.perf_counter() - started)
+        in_flight.dec()
+
+
+def count_profile(profile, kind, amount):
+    if settings.METRICS_ENABLED and profile is not None and amount:
+        PROFILE_ITEMS.labels(profile.profile_name, kind).inc(amount)
+
+
+def start_worker_metrics_server():
+    """Serve the metrics of a Celery worker process on ``METRICS_WORKER_PORT``."""
+    if settings.METRICS_ENABLED and settings.METRICS_WORKER_PORT:
+        start_http_server(settings.METRICS_WORKER_PORT)
+        logger.info(f"Serving metrics on port {settings.METRICS_WORKER_PORT}")
@@ -0,0 +1,122 @@
+import logging
+import queue
+import threading
+import time
+
+from django.db import connections
+
+from tiktokparser.utils.metrics import track
+
+logger = logging.getLogger(__name__)
+
+_DONE = object()
+
+
+class Stage:
+    """
+    One step of a ``StagePipeline``: ``fn(item)`` is called by ``workers``
+    threads and its result is passed on to the next stage. ``None`` results
+    are dropped.
+    """
+
+    def __init__(self, name, fn, workers=1):
+        self.name = name
+        self.fn = fn
+        self.workers = workers
+        self.busy_seconds = 0.0
+        self.items = 0
+
+
+class StagePipeline:
+    """
+    Streams items from a source through stages connected by bounded queues.
+
+    Every stage runs in its own worker threads, so the stages overlap and a
+    full queue blocks the stage in front of it; throughput is limited by the
+    slowest stage. The first exception stops the source, the remaining queued
+    items are drained without being processed and the exception is re-raised
+    from ``run()``.
+    """
+
+    def __init__(self, name, stages, queue_size):
+        self.name = name
+        self.stages = stages
+        self.queue_size = queue_size
+        self._error = None
+        self._failed = threading.Event()
+        self._lock = threading.Lock()
+
+    def run(self, source):
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages]
+        remaining = [stage.workers for stage in self.stages]
+        threads = [
+            threading.Thread(
+                target=self._work,
+                args=(index, queues, remaining),
+                name=f"pipeline-{stage.name}",
+                daemon=True,
+            )
+            for index, stage in enumerate(self.stages)
+            for _ in range(stage.workers)
+        ]
+        for thread in threads:
+            thread.start()
+
+        try:
+            for item in source:
+                if self._failed.is_set():
+                    break
+                queues[0].put(item)
+        except Exception as e:
+            self._fail(e)
+        finally:
+            for _ in range(self.stages[0].workers):
+                queues[0].put(_DONE)
+            for thread in threads:
+                thread.join()
+
+        timings = ", ".join(
+            f"{stage.name} {stage.items} items in {stage.busy_seconds:.1f}s"
+            for stage in self.stages
+        )
+        logger.info(f"Pipeline {self.name} stages: {timings}")
+        if self._error:
+            raise self._error
+
+    def _fail(self, error):
+        with self._lock:
+            if self._error is None:
+                self._error = error
+        self._failed.set()
+
+    def _work(self, index, queues, remaining):
+        stage = self.stages[index]
+        next_queue = queues[index + 1] if index + 1 < len(queues) else None
+        try:
+            while True:
+                item = queues[index].get()
+                if item is _DONE:
+                    break
+                if self._failed.is_set():
+                    continue
+                started = time.monotonic()
+                try:
+                    with track(f"{self.name}_{stage.name}"):
+                        result = stage.fn(item)
+                except Exception as e:
+                    logger.exception(f"Pipeline stage {stage.name} failed")
+                    self._fail(e)
+                    continue
+                with self._lock:
+                    stage.busy_seconds += time.monotonic() - started
+                    stage.items += 1
+                if result is not None and next_queue is not None:
+                    next_queue.put(result)
+        finally:
+            connections.close_all()
+            with self._lock:
+                remaining[index] -= 1
+                last_worker = remaining[index] == 0
+            if last_worker and next_queue is not None:
+                for _ in range(self.stages[index + 1].workers):
+                    next_queue.put(_DONE)
@@ -1,4 +1,129 @@
+import io
+
+from django.conf import settings
 from storages.backends.s3 import S3Storage
+from storages.utils import clean_name
+
+from tiktokparser.utils.metrics import track
+
+# S3 rejects multipart parts under 5MB (except the last one) and copies over 5GB
+MIN_PART_SIZE = 5 * 1024 * 1024
+MAX_COPY_PART_SIZE = 5 * 1024 * 1024 * 1024
+
+
+class S3MultipartWriter(io.RawIOBase):
+    """
+    Write-only, non-seekable stream that uploads to an S3 object in fixed-size
+    multipart parts, so at most one part is held in memory at a time.
+    """
+
+    def __init__(self, obj, part_size, **upload_params):
+        super().__init__()
+        self.name = None
+        self._obj = obj
+        self._part_size = part_size
+        self._upload_params = upload_params
+        self._upload = None
+        self._parts = []
+        self._buffer = bytearray()
+        self._position = 0
+
+    def writable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def write(self, data):
+        view = memoryview(data).cast("B")
+        written = len(view)
+        while view:
+            room = self._part_size - len(self._buffer)
+            self._buffer += view[:room]
+            view = view[room:]
+            if len(self._buffer) >= self._part_size:
+                self._upload_part()
+        self._position += written
+        return written
+
+    def copy_range(self, source, start, end):
+        """
+        Append bytes ``start`` to ``end`` of the S3 object ``source``. Ranges
+        large enough to be parts of their own are copied server-side with
+        UploadPartCopy; the rest is read into the part buffer.
+        """
+        while start < end:
+            if self._buffer or end - start < MIN_PART_SIZE:
+                size = min(end - start, self._part_size - len(self._buffer))
+                body = source.get(Range=f"bytes={start}-{start + size - 1}")["Body"]
+                self.write(body.read())
+            else:
+                size = min(end - start, MAX_COPY_PART_SIZE)
+                self._copy_part(source, start, size)
+                self._position += size
+            start += size
+
+    def _next_part_number(self):
+        if self._upload is None:
+            self._upload = self._obj.initiate_multipart_upload(**self._upload_params)
+        return len(self._parts) + 1
+
+    def _copy_part(self, source, start, size):
+        part_number = self._next_part_number()
+        with track("s3_copy_part") as tracker:
+            response = self._upload.Part(part_number).copy_from(
+                CopySource={"Bucket": source.bucket_name, "Key": source.key},
+                CopySourceRange=f"bytes={start}-{start + size - 1}",
+            )
+            tracker.add(items=1, nbytes=size)
+        etag = response["CopyPartResult"]["ETag"]
+        self._parts.append({"ETag": etag, "PartNumber": part_number})
+
+    def _upload_part(self):
+        part_number = self._next_part_number()
+        with track("s3_upload_part") as tracker:
+            response = self._upload.Part(part_number).upload(Body=bytes(self._buffer))
+            tracker.add(items=1, nbytes=len(self._buffer))
+        self._parts.append({"ETag": response["ETag"], "PartNumber": part_number})
+        self._buffer.clear()
+
+    def close(self):
+        if self.closed:
+            return
+        try:
+            if self._upload is None:
+                # Small enough to fit in a single part, a plain PUT is cheaper.
+                with track("s3_upload_part") as tracker:
+                    self._obj.put(Body=bytes(self._buffer), **self._upload_params)
+                    tracker.add(items=1, nbytes=len(self._buffer))
+            else:
+                if self._buffer:
+                    self._upload_part()
+                self._upload.complete(MultipartUpload={"Parts": self._parts})
+        except Exception:
+            self.abort()
+            raise
+        finally:
+            self._buffer = bytearray()
+        super().close()
+
+    def abort(self):
+        if self._upload is not None:
+            self._upload.abort()
+            self._upload = None
+        self._buffer = bytearray()
+        super().close()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.abort()
+        else:
+            self.close()
+
+    def __del__(self):
+        # Never complete a half-written upload just because it was collected.
+        if not self.closed:
+            self.abort()
 
 
 class StaticS3Storage(S3Storage):
@@ -9,3 +134,30 @@ class StaticS3Storage(S3Storage):
 class MediaS3Storage(S3Storage):
     location = "media"
     file_overwrite = False
+
+    def open_multipart_writer(self, name, part_size=None):
+        """
+        Reserve ``name`` and return a ``S3MultipartWriter`` streaming into it.
+        The final (possibly renamed) storage name is available as ``writer.name``.
+        """
+        name = self.get_available_name(name)
+        writer = S3MultipartWriter(
+            self.get_object(name),
+            part_size or settings.ARCHIVE_UPLOAD_PART_SIZE,
+            **self._get_write_parameters(name),
+        )
+        writer.name = name
+        return writer
+
+    def put_fileobj(self, name, fileobj):
+        """
+        Reserve ``name`` and upload ``fileobj`` to it with a single PUT that
+        streams from the file. Returns the final (possibly renamed) name.
+        """
+        name = self.get_available_name(name)
+        self.get_object(name).put(Body=fileobj, **self._get_write_parameters(name))
+        return name
+
+    def get_object(self, name):
+        """The boto3 ``s3.Object`` stored under ``name``."""
+        return self.bucket.Object(self._normalize_name(clean_name(name)))